@@ -1,3 +1,5 @@
+import hashlib
+import os
 import numpy as np
 from PIL import Image
 import random
@@ -34,77 +36,249 @@ BITMAP_OBSTACLES = 'bitmap_obstacles_128.bmp'
 BITMAP_DRONES = 'bitmap_drones_128.bmp'
 CELL_TYPE = np.int8  # Daha küçük integer tipi, negatif değerleri destekler
 PAD = 2  # Padding eklenmesi
+MAP_CACHE_DIR = 'map_cache'  # Preprocessed map layers, keyed by bitmap path and mtime
+MAP_CACHE_VERSION = 1        # Bumped whenever preprocessing changes
+
+# Grid update engines
+ENGINE_LOOP = 'loop'    # Reference implementation: cell-by-cell Python loop
+ENGINE_NUMPY = 'numpy'  # Same rules as batched NumPy operations over all drones
+ENGINE_JIT = 'jit'      # Same rules compiled with Numba; falls back to the loop without it
+ENGINE_LOOKUP = 'lookup'  # NumPy engine with the decisions memoized per neighbourhood
+
+
+class SimulationConfig:
+    """
+    Geometry and map of one simulation. Every run and every grid can have its own;
+    the module-level parameters are only the defaults. The zone radii and PAD are
+    shared by all engines, whose rules are written for them.
+    """
+
+    def __init__(self, grid_w=GRID_W, grid_h=GRID_H, bitmap_obstacles=BITMAP_OBSTACLES,
+                 bitmap_drones=BITMAP_DRONES, cell_type=CELL_TYPE):
+        self.grid_w = grid_w
+        self.grid_h = grid_h
+        self.bitmap_obstacles = bitmap_obstacles
+        self.bitmap_drones = bitmap_drones
+        self.cell_type = np.dtype(cell_type)
+
+    @classmethod
+    def from_grid(cls, grid):
+        """Configuration of an existing padded grid; bitmaps stay the defaults."""
+        return cls(grid.shape[0] - 2*PAD, grid.shape[1] - 2*PAD, cell_type=grid.dtype)
+
+    @property
+    def padded_shape(self):
+        return (self.grid_w + 2*PAD, self.grid_h + 2*PAD, L_COLL2 + 1)
+
+    def __repr__(self):
+        return (f'SimulationConfig({self.grid_w}x{self.grid_h}, {self.bitmap_obstacles!r}, '
+                f'{self.bitmap_drones!r}, {self.cell_type})')
+
+
+# Collision avoidance layers L_COLL1 and L_COLL2 of a padded grid: both
+# depend on cell coordinates only, so they can be rebuilt at any time
+def collision_layers(grid_wp, grid_hp, cell_type=CELL_TYPE):
+    xs = (np.arange(grid_wp) % 2)[:, None]
+    ys = (np.arange(grid_hp) % 2)[None, :]
+    coll1 = (xs == ys).astype(cell_type)
+    coll2 = np.broadcast_to(xs, (grid_wp, grid_hp)).astype(cell_type)
+    return coll1, coll2
+
+
+# Preprocessing of the bitmaps into the padded obstacle, drone and visit layers,
+# stacked as a (3, W+2*PAD, H+2*PAD) array
+def preprocess_map(config):
+    grid_w, grid_h, cell_type = config.grid_w, config.grid_h, config.cell_type
 
-# Grid initialization as a multi-layered Numpy array
-def init_grid():
     # Layer 0: obstacles:
-    img_obstacles = Image.open(BITMAP_OBSTACLES).convert('L')  # Monochrome
+    img_obstacles = Image.open(config.bitmap_obstacles).convert('L')  # Monochrome
     img_w, img_h = img_obstacles.size
-    if img_w < GRID_W or img_h < GRID_H:
-        print(f'Obstacle layer bitmap ({BITMAP_OBSTACLES}) not big enough: '
-              f'{img_w}x{img_h} instead of required minimum of {GRID_W}x{GRID_H}')
+    if img_w < grid_w or img_h < grid_h:
+        print(f'Obstacle layer bitmap ({config.bitmap_obstacles}) not big enough: '
+              f'{img_w}x{img_h} instead of required minimum of {grid_w}x{grid_h}')
         exit(0)
-    np_obstacles = (np.array(img_obstacles) < 128).astype(CELL_TYPE)
-    np_obstacles = np_obstacles[:GRID_W, :GRID_H]
+    np_obstacles = (np.array(img_obstacles) < 128).astype(cell_type)
+    np_obstacles = np_obstacles[:grid_w, :grid_h]
     obst_mask = np_obstacles == 1
     np_obstacles_padded = np.pad(np_obstacles, pad_width=PAD, mode='constant', constant_values=1)
 
     # Layer 1: drones
-    img_drones = Image.open(BITMAP_DRONES).convert('L')  # Monochrome
+    img_drones = Image.open(config.bitmap_drones).convert('L')  # Monochrome
     img_w, img_h = img_drones.size
-    if img_w < GRID_W or img_h < GRID_H:
-        print(f'Drone layer bitmap ({BITMAP_OBSTACLES}) not big enough: '
-              f'{img_w}x{img_h} instead of required minimum of {GRID_W}x{GRID_H}')
+    if img_w < grid_w or img_h < grid_h:
+        print(f'Drone layer bitmap ({config.bitmap_drones}) not big enough: '
+              f'{img_w}x{img_h} instead of required minimum of {grid_w}x{grid_h}')
         exit(0)
-    np_drones = (np.array(img_drones) < 128).astype(CELL_TYPE)
-    np_drones = np_drones[:GRID_W, :GRID_H]
+    np_drones = (np.array(img_drones) < 128).astype(cell_type)
+    np_drones = np_drones[:grid_w, :grid_h]
     np_drones[np_drones == 1] = DR_HERE
     np_drones[obst_mask] = DR_NONE
     np_drones_padded = np.pad(np_drones, pad_width=PAD, mode='constant', constant_values=DR_NONE)
 
     # Layer 2: visits
-    np_visits = np.zeros_like(np_obstacles).astype(CELL_TYPE)
+    np_visits = np.zeros_like(np_obstacles).astype(cell_type)
     np_visits[obst_mask] = V_UNREACHABLE
     np_visits_padded = np.pad(np_visits, pad_width=PAD, mode='constant', constant_values=V_UNREACHABLE)
 
-   
-#########################################################
-
-
-    # Layer 3: additional
-    np_grads_padded = np.zeros_like(np_visits_padded).astype(CELL_TYPE)
-
-    # Layer 4: collision avoidance 1
-    np_coll1_padded = np.zeros_like(np_visits_padded).astype(CELL_TYPE)
-    for x in range(np_coll1_padded.shape[0]):
-        for y in range(np_coll1_padded.shape[1]):
-            if x%2 == y%2:
-                np_coll1_padded[x, y] = 1
-
-    # Layer 5: collision avoidance 2
-    np_coll2_padded = np.zeros_like(np_visits_padded).astype(CELL_TYPE)
-    for x in range(np_coll2_padded.shape[0]):
-        for y in range(np_coll2_padded.shape[1]):
-            if x%2:
-                np_coll2_padded[x, y] = 1
-
-    # Full multi-layered grid
-    np_grid = np.stack((np_obstacles_padded, 
-                        np_drones_padded, 
-                        np_visits_padded, 
-                        np_grads_padded,
-                        np_coll1_padded,
-                        np_coll2_padded), axis=-1)
-    print(f'Grid initialized as Numpy array of shape {np_grid.shape}, {(np_drones == DR_HERE).sum()} drones')
+    return np.stack((np_obstacles_padded, np_drones_padded, np_visits_padded))
+
+
+# Cache file of the preprocessed layers: its name depends on the paths and
+# modification times of both bitmaps and on the geometry, so an edited bitmap
+# or another map size never picks up a stale file
+def map_cache_path(config, cache_dir=MAP_CACHE_DIR):
+    key = [MAP_CACHE_VERSION, config.grid_w, config.grid_h, PAD, config.cell_type.str]
+    for path in (config.bitmap_obstacles, config.bitmap_drones):
+        key += [os.path.abspath(path), os.stat(path).st_mtime_ns]
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f'map_{config.grid_w}x{config.grid_h}_{digest}.npy')
+
+
+# Preprocessed layers of the map, memory-mapped from the cache if it has them,
+# otherwise decoded from the bitmaps and stored in the cache (None: no cache)
+def load_map_layers(config, cache_dir=MAP_CACHE_DIR):
+    if cache_dir is None:
+        return preprocess_map(config)
+    path = map_cache_path(config, cache_dir)
+    if os.path.exists(path):
+        return np.load(path, mmap_mode='r')
+    layers = preprocess_map(config)
+    # Written under a temporary name, so that a concurrent reader
+    # never sees a partially written file
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as file:
+        np.save(file, layers)
+    os.replace(temp_path, path)
+    return layers
+
+
+# Grid initialization as a multi-layered Numpy array
+# Map size and bitmaps are taken from the config, the module defaults without one
+def init_grid(config=None, cache_dir=MAP_CACHE_DIR):
+    if config is None:
+        config = SimulationConfig()
+    np_obstacles_padded, np_drones_padded, np_visits_padded = load_map_layers(config, cache_dir)
+    grid_wp, grid_hp = np_obstacles_padded.shape
+
+    # Full multi-layered grid, with layer 3 (additional) empty and
+    # layers 4 and 5 (collision avoidance) given by the cell coordinates
+    np_grid = np.empty((grid_wp, grid_hp, L_COLL2 + 1), dtype=config.cell_type)
+    np_grid[..., L_OBST] = np_obstacles_padded
+    np_grid[..., L_DRON] = np_drones_padded
+    np_grid[..., L_VIS] = np_visits_padded
+    np_grid[..., L_GRAD] = 0
+    np_grid[..., L_COLL1], np_grid[..., L_COLL2] = collision_layers(grid_wp, grid_hp, config.cell_type)
+    print(f'Grid initialized as Numpy array of shape {np_grid.shape}, '
+          f'{(np_drones_padded == DR_HERE).sum()} drones')
     return np_grid
 
 
+def calculate_progress(grid):
+    """Calculates the percentage of the operational area that has been visited."""
+    visit_layer = grid[:, :, L_VIS]
+    visited_cells = (visit_layer == V_VISITED).sum()  # Number of visited cells
+    total_cells = (visit_layer != V_UNREACHABLE).sum()  # Total number of cells excluding obstacles
+    return (visited_cells / total_cells) * 100
+
+
+class CoverageCounter:
+    """
+    Running counts of unreachable, unvisited and visited cells of the L_VIS layer,
+    kept up to date by update_grid, so that progress checks don't scan the grid.
+    With stacked=True, counts are kept per scenario of an (N, H, W, L) array.
+    """
+    VALUES = (V_UNREACHABLE, V_UNVISITED, V_VISITED)
+
+    def __init__(self, grid, stacked=False):
+        visit_layer = grid[..., L_VIS]
+        axis = (1, 2) if stacked else None
+        self.counts = np.stack([(visit_layer == value).sum(axis=axis) for value in self.VALUES],
+                               axis=-1).astype(np.int64)
+        # Rows of one scenario in the stacked grid viewed as a single tall grid
+        self.rows = grid.shape[1] if stacked else None
+
+    def record(self, old_values, new_values, cells_x=None):
+        """Accounts for L_VIS cells changed from old_values to new_values.
+        For stacked counters, cells_x are the x coordinates of these cells in the tall grid."""
+        changed = old_values != new_values
+        old_index = old_values[changed].astype(np.intp) - V_UNREACHABLE
+        new_index = new_values[changed].astype(np.intp) - V_UNREACHABLE
+        if self.rows is None:
+            self.counts -= np.bincount(old_index, minlength=len(self.VALUES))
+            self.counts += np.bincount(new_index, minlength=len(self.VALUES))
+        else:
+            scenario = cells_x[changed] // self.rows
+            np.add.at(self.counts, (scenario, old_index), -1)
+            np.add.at(self.counts, (scenario, new_index), 1)
+
+    @property
+    def unreachable(self):
+        return self.counts[..., 0]
+
+    @property
+    def unvisited(self):
+        return self.counts[..., 1]
+
+    @property
+    def visited(self):
+        return self.counts[..., 2]
+
+    def progress(self):
+        """Same percentage as calculate_progress, in O(1)."""
+        return self.visited / (self.visited + self.unvisited) * 100
+
+
 # Upoating of the grid: drones make decisions, move and change their surroundings
-def update_grid(grid, iter_count=0):
+# If a CoverageCounter is given, it's updated with the cells the drones visit
+# If a dsa_profile.StepProfiler is given, it records the time and counters of the step
+# If a guide (dsa_frontier.FrontierIndex or dsa_gradient.GradientField) is given as frontier,
+# drones that gain nothing nearby head for the nearest unvisited cell instead of a random
+# move (and, unless the guide keeps_heading, instead of their heading), and the guide is
+# updated with the visited cells
+def update_grid(grid, iter_count=0, engine=ENGINE_LOOP, coverage=None, profiler=None, frontier=None):
+    if engine == ENGINE_JIT:
+        from dsa_jit import JIT_AVAILABLE, update_grid_jit as update
+        if not JIT_AVAILABLE:
+            engine = ENGINE_LOOP
+    if engine == ENGINE_NUMPY:
+        from dsa_vectorized import update_grid_vectorized as update
+    elif engine == ENGINE_LOOKUP:
+        from dsa_lookup import update_grid_lookup as update
+    elif engine == ENGINE_LOOP:
+        update = update_grid_loop
+    elif engine != ENGINE_JIT:
+        print(f'Unknown grid update engine: {engine}')
+        return None
+
+    if profiler is None:
+        return update(grid, iter_count, coverage, frontier=frontier)
+    profiler.begin(iter_count, engine)
+    new_grid = update(grid, iter_count, coverage, profiler, frontier)
+    profiler.end()
+    return new_grid
+
+
+# Moves among possible_moves that best follow the direction (gx, gy), if any goes that way
+def guided_moves(possible_moves, gx, gy):
+    scores = [dx * gx + dy * gy for dx, dy in possible_moves]
+    best_score = max(scores, default=0)
+    if best_score <= 0:
+        return []
+    return [pm for pm, score in zip(possible_moves, scores) if score == best_score]
+
+
+# Reference engine: every cell of the grid is handled in turn
+def update_grid_loop(grid, iter_count=0, coverage=None, profiler=None, frontier=None):
     new_grid = grid.copy()
-
-    for x in range(GRID_W):
-        for y in range(GRID_H):
+    # The grid carries its own size
+    grid_w, grid_h = grid.shape[0] - 2*PAD, grid.shape[1] - 2*PAD
+    # Drones that write their big zones back; the frontier index is
+    # updated after the scan, so that all drones see the same index
+    written_x, written_y = [], []
+
+    for x in range(grid_w):
+        for y in range(grid_h):
             # What kind of content does this cell have?
             cell_drone_val = int(grid[PAD+x, PAD+y, L_DRON])
             # If cell has no drone-related information or 
@@ -114,6 +288,8 @@ def update_grid(grid, iter_count=0):
             
             # If cell is marked as nearest to some drone or a vector point - check if the drone is still nearby
             if cell_drone_val in (DR_NEAR, DR_VECT):
+                if profiler is not None:
+                    profiler.count('marks_checked')
                 drone_near = False
                 for dx in range(-1, 1+1):
                     if drone_near:
@@ -130,6 +306,8 @@ def update_grid(grid, iter_count=0):
                 if not drone_near:
                     # No drone nearby, this is a DR_NONE
                     new_grid[PAD+x, PAD+y, L_DRON] = DR_NONE
+                    if profiler is not None:
+                        profiler.count('marks_cleared')
                 continue
 
             # If cell doesn't contain a drone at this point - something is
@@ -137,6 +315,8 @@ def update_grid(grid, iter_count=0):
             if cell_drone_val != DR_HERE:
                 print(f'Problem with cell drone value: {cell_drone_val} at {x}, {y}')
                 return None
+            if profiler is not None:
+                profiler.count('drones')
             
             # Otherwise - this cell contains a drone, and it must make a decision
             # "Big zone" - 5x5 square with the drone in the center,
@@ -189,9 +369,9 @@ def update_grid(grid, iter_count=0):
                     if dx == dy == 0:
                         # Standing still is not an option
                         continue
-                    if drone_x+dx >= GRID_W or 0 >= drone_x+dx:
+                    if drone_x+dx >= grid_w or 0 >= drone_x+dx:
                         continue
-                    if drone_y+dy >= GRID_H or 0 >= drone_y+dy:
+                    if drone_y+dy >= grid_h or 0 >= drone_y+dy:
                         continue
                     possible_moves.append((dx, dy))
 
@@ -266,6 +446,8 @@ def update_grid(grid, iter_count=0):
 
             if not len(possible_moves):
                 possible_moves = [(0, 0)]
+            if profiler is not None and thrust_away:
+                profiler.count('thrust_away')
 
             # If drone is already stuck inside an obstacle - remove it
             if np_obst[drone_x, drone_y]:
@@ -299,12 +481,19 @@ def update_grid(grid, iter_count=0):
                 mov_dx, mov_dy = random.choice(best_moves)[0]
             else:
                 # If no move leads to any gain - continue moving in the same direction
-                if len(prev_coords):  
+                # or head for the nearest unvisited cell, if known, in the guide's order
+                heading_ok = len(prev_coords) > 0 and (-prev_x, -prev_y) in possible_moves
+                best_moves = []
+                if frontier is not None and not (heading_ok and frontier.keeps_heading):
+                    gx, gy = frontier.directions(grid, np.array([PAD+x]), np.array([PAD+y]))
+                    best_moves = guided_moves(possible_moves, int(gx[0]), int(gy[0]))
+                if len(best_moves):
+                    mov_dx, mov_dy = random.choice(best_moves)
+                elif heading_ok:
                     mov_dx = -prev_x
                     mov_dy = -prev_y
-                    if (mov_dx, mov_dy) not in possible_moves:
-                        mov_dx, mov_dy = random.choice(possible_moves)
                 else:
+                    # If neither is possible - move at random
                     mov_dx, mov_dy = random.choice(possible_moves)
 
             # Final cleanup of possible moves
@@ -322,6 +511,12 @@ def update_grid(grid, iter_count=0):
             if not len(possible_moves):
                 possible_moves = [(0, 0)]
 
+            if profiler is not None:
+                if remove_this_drone:
+                    profiler.count('removed')
+                elif possible_moves == [(0, 0)]:
+                    profiler.count('stuck')
+
             if not remove_this_drone:  
                 # Drone moves and changes drone-related values around it
                 # 1. Drone's nearest cells (DR_NEAR) aren't these anymore
@@ -390,5 +585,12 @@ def update_grid(grid, iter_count=0):
                                     np_grad,
                                     np_coll1,
                                     np_coll2), axis=-1)
+            if coverage is not None:
+                coverage.record(new_grid[big_zone_index][..., L_VIS], np_visit)
             new_grid[big_zone_index] = np_big_zone
+            written_x.append(PAD+x)
+            written_y.append(PAD+y)
+
+    if frontier is not None:
+        frontier.record_zones(np.array(written_x, dtype=int), np.array(written_y, dtype=int), grid, new_grid)
     return new_grid
\ No newline at end of file
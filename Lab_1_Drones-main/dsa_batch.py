@@ -0,0 +1,139 @@
+import random
+import time
+from multiprocessing import Pool, shared_memory
+import numpy as np
+from dsa_automaton import init_grid, update_grid, CoverageCounter
+from dsa_automaton import ENGINE_LOOP, L_DRON, DR_HERE
+from dsa_metrics import StepSummary
+from dsa_profile import StepCounter
+from dsa_stopping import StoppingRule
+
+# Batch parameters
+BATCH_SEED = 0  # Trial i is seeded with BATCH_SEED + i
+
+# Initial grid shared by all trials of a worker process
+shared_grid = None
+shared_grid_memory = None
+
+
+def attach_shared_grid(name, shape, dtype):
+    """Pool initializer: maps the initial grid from shared memory."""
+    global shared_grid, shared_grid_memory
+    shared_grid_memory = shared_memory.SharedMemory(name=name)
+    shared_grid = np.ndarray(shape, dtype=dtype, buffer=shared_grid_memory.buf)
+
+
+def run_trial(trial, seed, threshold, engine, stopping=None, guide=None):
+    """
+    Runs one seeded simulation from the shared initial grid until the threshold is reached
+    or the dsa_stopping.StoppingRule (by default, one that only detects stalls) stops it,
+    with a new guide of the given kind, if any (see dsa_main.continue_simulation).
+    Returns the trial results as a dictionary.
+    Drones removed are counted by the engines, see dsa_profile.StepCounter.
+    """
+    random.seed(seed)
+    grid = shared_grid.copy()
+    frontier = guide(grid) if guide is not None else None
+    removals = StepCounter(('removed',))
+    coverage = CoverageCounter(grid)
+    start = time.perf_counter()
+    if stopping is None:
+        stopping = StoppingRule()
+    stopping.start(0)
+    iter_count = 0
+
+    while coverage.progress() < threshold:
+        if stopping.should_stop(grid, iter_count, coverage.progress()):
+            break
+        grid = update_grid(grid, iter_count, engine=engine, coverage=coverage, profiler=removals,
+                           frontier=frontier)
+        iter_count += 1
+
+    return {
+        'trial': trial,
+        'seed': seed,
+        'iterations': iter_count,
+        'coverage': float(coverage.progress()),
+        'stopped': stopping.reason,
+        'drones_removed': removals.totals['removed'],
+        'visited': int(coverage.visited),
+        'unvisited': int(coverage.unvisited),
+        'active_drones': int((grid[..., L_DRON] == DR_HERE).sum()),
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def trial_summary(result):
+    """dsa_metrics.StepSummary of the last step of a trial, with the mean step time of the trial."""
+    steps, seconds = result['iterations'], result['seconds']
+    return StepSummary(
+        iteration=steps,
+        coverage=result['coverage'],
+        visited=result['visited'],
+        unvisited=result['unvisited'],
+        active_drones=result['active_drones'],
+        step_seconds=seconds / steps if steps > 0 else None,
+        steps_per_second=steps / seconds if steps > 0 and seconds > 0 else None,
+        timestamp=time.time(),
+    )
+
+
+def run_trial_args(args):
+    return run_trial(*args)
+
+
+def run_batch(simulation_count=10, threshold=75, engine=ENGINE_LOOP,
+              processes=None, base_seed=BATCH_SEED, grid=None, config=None, stopping=None, guide=None):
+    """
+    Runs independent seeded trials in a process pool and yields
+    their results as soon as they finish (not in trial order).
+    The initial grid (given, or built from the config) is built once
+    and shared with the workers through shared memory. The guide, if any, is
+    a class (or other picklable factory), every trial builds its own from its grid.
+    """
+    if grid is None:
+        grid = init_grid(config)
+    memory = shared_memory.SharedMemory(create=True, size=grid.nbytes)
+    try:
+        np.ndarray(grid.shape, dtype=grid.dtype, buffer=memory.buf)[...] = grid
+        trials = [(trial, base_seed + trial, threshold, engine, stopping, guide)
+                  for trial in range(simulation_count)]
+        with Pool(processes, initializer=attach_shared_grid,
+                  initargs=(memory.name, grid.shape, grid.dtype)) as pool:
+            for result in pool.imap_unordered(run_trial_args, trials):
+                yield result
+    finally:
+        memory.close()
+        memory.unlink()
+
+
+def run_parallel_simulations(simulation_count=10, threshold=75, engine=ENGINE_LOOP, processes=None,
+                             config=None, stopping=None, metrics=None, guide=None):
+    """
+    Parallel counterpart of dsa_main.run_multiple_simulations.
+    Prints every trial as it finishes, then the statistics of the trials
+    that reached the threshold; returns all trial results.
+    Trials run in other processes, so a dsa_metrics.MetricsObserver gets
+    one summary per trial as it finishes (see trial_summary), not per step.
+    """
+    results = []
+    for result in run_batch(simulation_count, threshold, engine, processes, config=config, stopping=stopping,
+                            guide=guide):
+        if metrics is not None:
+            metrics.publish(trial_summary(result))
+        stopped = '' if result['stopped'] is None else f", stopped ({result['stopped']})"
+        print(f"Trial {result['trial']} (seed {result['seed']}): {result['iterations']} iterations, "
+              f"{result['coverage']:.2f}% coverage, {result['drones_removed']} drones removed{stopped}")
+        results.append(result)
+
+    iterations = [result['iterations'] for result in results if result['stopped'] is None]
+    if not iterations:
+        print("No trial reached the threshold")
+        return results
+    print("Minimum Number of Iterations:", min(iterations))
+    print("Maximum Number of Iterations:", max(iterations))
+    print("Average Number of Iterations:", sum(iterations) / len(iterations))
+    return results
+
+if __name__ == '__main__':
+    run_parallel_simulations()
@@ -0,0 +1,314 @@
+import argparse
+import datetime
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+import numpy as np
+from dsa_automaton import update_grid, CoverageCounter, ENGINE_LOOP, ENGINE_NUMPY, ENGINE_JIT, ENGINE_LOOKUP
+from dsa_automaton import L_DRON, DR_HERE
+from dsa_frontier import FrontierIndex
+from dsa_gradient import GradientField
+from dsa_jit import JIT_AVAILABLE
+from dsa_lookup import DECISION_CACHE
+from dsa_scenarios import SCENARIOS, SCENARIO_SEED, assemble_grid, make_scenario
+from dsa_sparse import SparseSwarm
+from dsa_tiled import TiledSwarm
+
+# Benchmark parameters
+BENCH_SIZES = (128, 512, 2048)
+SPARSE_MODE = 'sparse'  # dsa_sparse.SparseSwarm, benchmarked next to the engines
+BENCH_ENGINES = (ENGINE_LOOP, ENGINE_NUMPY, ENGINE_JIT, ENGINE_LOOKUP, SPARSE_MODE)
+SCALING_SIZE = 4096
+SCALING_PROCESSES = (1, 2, 4, 8)
+BENCH_SEED = 1
+BENCH_MIN_TIME = 2.0     # Seconds spent stepping each engine, at least
+BENCH_MAX_STEPS = 50     # Steps made by each engine, at most
+DRONE_DENSITY = 0.002    # Share of free cells holding a drone
+OBSTACLE_DENSITY = 0.05  # Share of cells occupied by obstacles
+
+# Benchmark suite parameters
+SUITE_SIZES = (128, 512, 2048, 4096)
+SUITE_SCENARIOS = tuple(SCENARIOS)
+SUITE_MAX_SIZE = {ENGINE_LOOP: 512}  # Larger grids take the loop engine minutes per step
+SUITE_THRESHOLD = 75         # Coverage percentage to measure the time to
+SUITE_MAX_STEPS = 5000       # Steps of a coverage run, at most
+SUITE_TIME_LIMIT = 120.0     # Seconds of a coverage run, at most
+MEMORY_STEPS = 3             # Steps traced for the peak memory
+SUITE_RESULTS = 'benchmark_results.json'
+REGRESSION_TOLERANCE = 0.15  # Relative change of a metric that counts as a regression
+GUIDES = {'frontier': FrontierIndex, 'gradient': GradientField}  # Guides the suite can run with
+
+
+def make_random_grid(grid_w, grid_h, seed=BENCH_SEED,
+                     drone_density=DRONE_DENSITY, obstacle_density=OBSTACLE_DENSITY):
+    """
+    Builds a padded grid of the same layout as init_grid,
+    with obstacles and drones scattered at random.
+    """
+    rng = np.random.default_rng(seed)
+    obstacles = rng.random((grid_w, grid_h)) < obstacle_density
+    drones = rng.random((grid_w, grid_h)) < drone_density
+    return assemble_grid(obstacles, drones)
+
+
+def make_stepper(grid, engine, coverage=None, guide=None):
+    """
+    Returns a function that advances the grid by one step with the given engine,
+    keeping the CoverageCounter, if any, up to date (the sparse mode has its own).
+    The lookup engine starts with an empty cache, so that measurements don't depend on each other.
+    With a guide class (see dsa_main.continue_simulation), the stepper has a guide
+    of its own, built from a copy of the grid, since GradientField writes L_GRAD.
+    """
+    frontier = None
+    if guide is not None:
+        grid = grid.copy()
+        frontier = guide(grid)
+    if engine == SPARSE_MODE:
+        return SparseSwarm(grid, frontier).step
+    if engine == ENGINE_LOOKUP:
+        DECISION_CACHE.clear()
+    state = {'grid': grid}
+
+    def step(iter_count):
+        state['grid'] = update_grid(state['grid'], iter_count, engine=engine, coverage=coverage,
+                                    frontier=frontier)
+        return state['grid']
+    return step
+
+
+def steps_per_second(grid, engine, min_time=BENCH_MIN_TIME, max_steps=BENCH_MAX_STEPS, guide=None):
+    """Steps the grid with the given engine (and guide) and returns the achieved steps per second."""
+    random.seed(BENCH_SEED)
+    # Warm-up step, so that compilation of the JIT engine isn't measured
+    make_stepper(grid, engine, guide=guide)(0)
+    step = make_stepper(grid, engine, guide=guide)
+    steps = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while steps < max_steps and (elapsed < min_time or steps == 0):
+        step(steps)
+        steps += 1
+        elapsed = time.perf_counter() - start
+    return steps / elapsed
+
+
+def run_benchmark(sizes=BENCH_SIZES, engines=BENCH_ENGINES):
+    """
+    Measures steps per second of every engine on random grids of every size.
+    Prints the results to the terminal and returns them as {(size, engine): steps/s}.
+    """
+    results = {}
+    for size in sizes:
+        grid = make_random_grid(size, size)
+        drone_count = int((grid[..., L_DRON] == DR_HERE).sum())
+        for engine in engines:
+            results[(size, engine)] = steps_per_second(grid, engine)
+            print(f'{size}x{size}, {drone_count} drones, {engine}: '
+                  f'{results[(size, engine)]:.2f} steps/s, '
+                  f'{results[(size, engine)] * drone_count:.0f} drone-steps/s')
+    return results
+
+
+def run_scaling_benchmark(size=SCALING_SIZE, process_counts=SCALING_PROCESSES,
+                          min_time=BENCH_MIN_TIME, max_steps=BENCH_MAX_STEPS):
+    """
+    Measures steps per second of dsa_tiled.TiledSwarm on one random grid
+    with every number of worker processes, and the speed-up over a single one.
+    Returns the results as {processes: steps/s}.
+    """
+    grid = make_random_grid(size, size)
+    results = {}
+    for processes in process_counts:
+        random.seed(BENCH_SEED)
+        with TiledSwarm(grid, processes) as swarm:
+            swarm.step(0)
+            steps = 0
+            start = time.perf_counter()
+            elapsed = 0.0
+            while steps < max_steps and (elapsed < min_time or steps == 0):
+                swarm.step(steps)
+                steps += 1
+                elapsed = time.perf_counter() - start
+        results[processes] = steps / elapsed
+        print(f'{size}x{size}, tiled, {processes} processes: {results[processes]:.2f} steps/s, '
+              f'speed-up {results[processes] / results[process_counts[0]]:.2f}x')
+    return results
+
+
+def time_to_coverage(grid, engine, threshold=SUITE_THRESHOLD,
+                     max_steps=SUITE_MAX_STEPS, time_limit=SUITE_TIME_LIMIT, guide=None):
+    """
+    Steps the grid with the given engine (and a new guide of the given class, if any)
+    until the coverage threshold is reached. Returns the seconds and steps it took,
+    or None and the steps made if a limit came first.
+    """
+    random.seed(BENCH_SEED)
+    if engine == SPARSE_MODE:
+        if guide is not None:
+            grid = grid.copy()
+        swarm = SparseSwarm(grid, guide(grid) if guide is not None else None)
+        step, coverage = swarm.step, swarm.coverage
+    else:
+        coverage = CoverageCounter(grid)
+        step = make_stepper(grid, engine, coverage, guide)
+    steps = 0
+    start = time.perf_counter()
+    while coverage.progress() < threshold:
+        if steps >= max_steps or time.perf_counter() - start >= time_limit:
+            return None, steps
+        step(steps)
+        steps += 1
+    return time.perf_counter() - start, steps
+
+
+def peak_memory(grid, engine, steps=MEMORY_STEPS, guide=None):
+    """Peak of memory allocated while a copy of the grid is stepped a few times (guide included), in bytes."""
+    random.seed(BENCH_SEED)
+    tracemalloc.start()
+    try:
+        step = make_stepper(grid.copy(), engine, guide=guide)
+        for iter_count in range(steps):
+            step(iter_count)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def suite_engines(engines):
+    """The engines that can run here; without Numba the JIT engine would only repeat the loop."""
+    return [engine for engine in engines if engine != ENGINE_JIT or JIT_AVAILABLE]
+
+
+def run_suite(sizes=SUITE_SIZES, scenarios=SUITE_SCENARIOS, engines=BENCH_ENGINES,
+              seed=SCENARIO_SEED, path=SUITE_RESULTS, guide=None):
+    """
+    Measures steps per second, time to SUITE_THRESHOLD coverage and peak memory of
+    every engine on every generated scenario and size, with a guide of one of the
+    GUIDES classes, if given. Prints the results and writes
+    them, with the environment they were measured in, as JSON to path (if not None).
+    Returns the report as a dictionary.
+    """
+    results = []
+    for scenario in scenarios:
+        for size in sizes:
+            grid = make_scenario(scenario, size, seed)
+            drone_count = int((grid[..., L_DRON] == DR_HERE).sum())
+            for engine in suite_engines(engines):
+                if size > SUITE_MAX_SIZE.get(engine, size):
+                    continue
+                rate = steps_per_second(grid, engine, guide=guide)
+                coverage_time, coverage_steps = time_to_coverage(grid, engine, guide=guide)
+                result = {
+                    'scenario': scenario,
+                    'size': size,
+                    'engine': engine,
+                    'drones': drone_count,
+                    'steps_per_second': rate,
+                    'time_to_coverage': coverage_time,
+                    'steps_to_coverage': coverage_steps if coverage_time is not None else None,
+                    'decision_hit_rate': DECISION_CACHE.hit_rate if engine == ENGINE_LOOKUP else None,
+                    'peak_memory': peak_memory(grid, engine, guide=guide),
+                }
+                results.append(result)
+                coverage = ('not reached' if coverage_time is None else
+                            f'{coverage_time:.2f} s ({coverage_steps} steps)')
+                hit_rate = ('' if result['decision_hit_rate'] is None else
+                            f', decision cache hit rate {result["decision_hit_rate"] * 100:.1f}%')
+                print(f'{scenario} {size}x{size}, {drone_count} drones, {engine}: {rate:.2f} steps/s, '
+                      f'{SUITE_THRESHOLD}% coverage {coverage}, '
+                      f'peak memory {result["peak_memory"] / 2**20:.1f} MiB{hit_rate}')
+
+    report = {
+        'environment': {
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'jit': JIT_AVAILABLE,
+            'seed': seed,
+            'threshold': SUITE_THRESHOLD,
+            'guide': guide.__name__ if guide is not None else None,
+        },
+        'results': results,
+    }
+    if path is not None:
+        with open(path, 'w') as file:
+            json.dump(report, file, indent=2)
+    return report
+
+
+def compare_results(report, baseline, tolerance=REGRESSION_TOLERANCE):
+    """
+    Compares suite results with the baseline ones of the same scenario, size and engine.
+    Returns the descriptions of all regressions: a metric worse by more than the tolerance,
+    or a threshold that isn't reached anymore.
+    """
+    # Metric and whether higher values are better
+    metrics = (('steps_per_second', True), ('time_to_coverage', False), ('peak_memory', False))
+    baseline_results = {(result['scenario'], result['size'], result['engine']): result
+                        for result in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        key = (result['scenario'], result['size'], result['engine'])
+        if key not in baseline_results:
+            continue
+        name = '{} {}x{} {}'.format(key[0], key[1], key[1], key[2])
+        for metric, higher_is_better in metrics:
+            value, base = result[metric], baseline_results[key][metric]
+            if base is None:
+                continue
+            if value is None:
+                regressions.append(f'{name}: {metric} not reached anymore (baseline {base:.4g})')
+                continue
+            change = (value - base) / base
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append(f'{name}: {metric} {value:.4g} vs baseline {base:.4g} ({change:+.1%})')
+    return regressions
+
+
+def load_report(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def print_regressions(regressions):
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    print(f'{len(regressions)} regressions found')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of the grid update engines')
+    commands = parser.add_subparsers(dest='command')
+    suite = commands.add_parser('suite', help='run the scenario suite and save its results')
+    suite.add_argument('--sizes', type=int, nargs='+', default=SUITE_SIZES)
+    suite.add_argument('--scenarios', nargs='+', choices=SUITE_SCENARIOS, default=SUITE_SCENARIOS)
+    suite.add_argument('--engines', nargs='+', choices=BENCH_ENGINES, default=BENCH_ENGINES)
+    suite.add_argument('--seed', type=int, default=SCENARIO_SEED)
+    suite.add_argument('--output', default=SUITE_RESULTS)
+    suite.add_argument('--guide', choices=GUIDES, help='guide the drones that gain nothing nearby')
+    suite.add_argument('--baseline', help='results file to check the new results against')
+    suite.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE)
+    compare = commands.add_parser('compare', help='check saved results against a baseline')
+    compare.add_argument('results')
+    compare.add_argument('baseline')
+    compare.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args()
+
+    if args.command is None:
+        run_benchmark()
+        run_scaling_benchmark()
+    else:
+        if args.command == 'suite':
+            report = run_suite(args.sizes, args.scenarios, args.engines, args.seed, args.output,
+                               GUIDES.get(args.guide))
+            if args.baseline is None:
+                sys.exit(0)
+        else:
+            report = load_report(args.results)
+        regressions = compare_results(report, load_report(args.baseline), args.tolerance)
+        print_regressions(regressions)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,100 @@
+import os
+import random
+import threading
+import time
+import numpy as np
+
+# Checkpointing parameters
+CHECKPOINT_EVERY = 10000    # Iterations between checkpoints (None: no iteration limit)
+CHECKPOINT_INTERVAL = 600   # Seconds between checkpoints (None: no time limit)
+
+
+def save_checkpoint(path, grid, iter_count, rng_state):
+    """
+    Atomically saves the padded grid, the iteration count and the state of
+    the module-level random: the file is either the old or the new checkpoint.
+    """
+    version, internal_state, gauss_next = rng_state
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        np.savez(file,
+                 grid=grid,
+                 iter_count=iter_count,
+                 rng_version=version,
+                 rng_internal_state=np.array(internal_state, dtype=np.uint64),
+                 rng_gauss_next=np.nan if gauss_next is None else gauss_next)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+
+def load_checkpoint(path):
+    """
+    Loads a checkpoint and restores the module-level random to its saved state.
+    Returns the grid and the iteration count to continue from.
+    """
+    with np.load(path) as checkpoint:
+        gauss_next = float(checkpoint['rng_gauss_next'])
+        random.setstate((int(checkpoint['rng_version']),
+                         tuple(int(value) for value in checkpoint['rng_internal_state']),
+                         None if np.isnan(gauss_next) else gauss_next))
+        return checkpoint['grid'].copy(), int(checkpoint['iter_count'])
+
+
+class Checkpointer:
+    """
+    Saves checkpoints every `every` iterations or `interval` seconds, whichever
+    comes first. Files are written by a background thread; if it's still busy,
+    only the newest pending checkpoint is kept, so the stepping loop never waits.
+    """
+
+    def __init__(self, path, every=CHECKPOINT_EVERY, interval=CHECKPOINT_INTERVAL):
+        self.path = path
+        self.every = every
+        self.interval = interval
+        self.last_iter = 0
+        self.last_time = time.monotonic()
+        self.saved_checkpoints = 0
+        self.pending = None
+        self.stopping = False
+        self.error = None
+        self.condition = threading.Condition()
+        self.writer = threading.Thread(target=self.write_checkpoints, daemon=True)
+        self.writer.start()
+
+    def maybe_save(self, grid, iter_count):
+        """Saves a checkpoint of the state before iteration iter_count, if one is due."""
+        now = time.monotonic()
+        if ((self.every is not None and iter_count - self.last_iter >= self.every) or
+                (self.interval is not None and now - self.last_time >= self.interval)):
+            self.save(grid, iter_count)
+
+    def save(self, grid, iter_count):
+        self.last_iter = iter_count
+        self.last_time = time.monotonic()
+        with self.condition:
+            self.pending = (grid.copy(), iter_count, random.getstate())
+            self.condition.notify()
+
+    def close(self):
+        """Waits until the pending checkpoint, if any, is written."""
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
+        self.writer.join()
+        if self.error is not None:
+            raise self.error
+
+    def write_checkpoints(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.stopping:
+                    self.condition.wait()
+                if self.pending is None:
+                    return
+                pending, self.pending = self.pending, None
+            try:
+                save_checkpoint(self.path, *pending)
+                self.saved_checkpoints += 1
+            except Exception as error:
+                self.error = error
@@ -0,0 +1,52 @@
+import numpy as np
+from dsa_automaton import PAD
+from dsa_automaton import DR_HERE, DR_NEAR, DR_NONE, DR_VECT
+from dsa_automaton import V_VISITED, V_UNVISITED
+from dsa_automaton import L_OBST, L_DRON, L_VIS
+
+# Colour scheme shared by the pygame front end and the headless recorder
+COLOR_OBST = (0, 0, 0)          # Black: color for obstacle
+COLOR_NO_OBST = (255, 255, 255) # White: color for no obstacle; for initialization
+
+COLOR_DRONE = (0, 0, 205)       # Blue: drone is in this cell
+COLOR_DR_PR1 = (100,149,237)    # Dimmer blue: drone was last turn
+COLOR_DR_PR2 = (135,206,250)    # Even dimmer blue: drone was here 2 turns ago
+COLOR_DR_NEAR = (255, 0, 0)     # Red: drone can move here
+COLOR_DR_VECT = (64, 224, 208)  # Bright blue: drone is going there
+
+COLOR_VISIT = (50,205,50)        # This cell has been visited
+COLOR_NO_VISIT = (255,165,0)     # This cell hasn't been visited
+COLOR_UNREACHABLE = (255,99,71)  # This cell is unreachable
+
+# Colour lookup table: every cell gets one of these codes, then its palette colour
+C_OBST, C_DRONE, C_DR_NEAR, C_DR_VECT, C_VISIT, C_NO_VISIT, C_UNREACHABLE, C_UNEXPECTED = range(8)
+PALETTE = np.array([COLOR_OBST, COLOR_DRONE, COLOR_DR_NEAR, COLOR_DR_VECT,
+                    COLOR_VISIT, COLOR_NO_VISIT, COLOR_UNREACHABLE, COLOR_NO_OBST], dtype=np.uint8)
+# Codes by layer value, indexed by the value as an unsigned byte; -1: no drone information
+DRONE_CODES = np.full(256, C_UNEXPECTED, dtype=np.int8)
+DRONE_CODES[[DR_NONE, DR_HERE, DR_NEAR, DR_VECT]] = [-1, C_DRONE, C_DR_NEAR, C_DR_VECT]
+VISIT_CODES = np.full(256, C_UNREACHABLE, dtype=np.int8)
+VISIT_CODES[[V_VISITED, V_UNVISITED]] = [C_VISIT, C_NO_VISIT]
+
+
+# Colour codes of all cells of the operational area, (GRID_W, GRID_H),
+# or None if the drone layer holds an unexpected value
+def grid_codes(grid):
+    interior = grid[PAD:grid.shape[0]-PAD, PAD:grid.shape[1]-PAD, :]
+    codes = VISIT_CODES[interior[..., L_VIS].view(np.uint8)]
+    drone_codes = DRONE_CODES[interior[..., L_DRON].view(np.uint8)]
+    codes = np.where(drone_codes >= 0, drone_codes, codes)
+    codes[interior[..., L_OBST] != 0] = C_OBST
+    if (codes == C_UNEXPECTED).any():
+        x, y = np.argwhere(codes == C_UNEXPECTED)[0]
+        print(f'Unexpected value in drone layer: {grid[PAD+x, PAD+y, L_DRON]} at {y}, {x}')
+        return None
+    return codes
+
+
+# RGB image of the operational area, (GRID_W, GRID_H, 3), or None on unexpected drone values
+def grid_colors(grid):
+    codes = grid_codes(grid)
+    if codes is None:
+        return None
+    return PALETTE[codes]
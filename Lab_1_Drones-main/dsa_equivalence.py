@@ -0,0 +1,156 @@
+import random
+import sys
+import numpy as np
+from dsa_automaton import update_grid, CoverageCounter, L_GRAD
+from dsa_automaton import ENGINE_LOOP, ENGINE_NUMPY, ENGINE_JIT, ENGINE_LOOKUP
+from dsa_frontier import FrontierIndex
+from dsa_gradient import GradientField
+from dsa_lookup import DECISION_CACHE, DecisionCache, update_grid_lookup
+from dsa_multi import update_grids
+from dsa_scenarios import make_scenario, scenario_maps, assemble_grid
+from dsa_sparse import SparseSwarm
+from dsa_tiled import TiledSwarm
+
+# Equivalence check parameters
+CHECK_SCENARIOS = ('dense_clutter', 'maze')  # Scenarios stepped by every engine and mode
+CHECK_SIZE = 48                              # Side of their maps
+CHECK_STEPS = 25                             # Steps compared
+CHECK_SEED = 1                               # Seed of the module-level random of every run
+CHECK_PROCESSES = 2                          # Worker processes of the tiled mode
+CHECK_CACHE_SIZE = 16                        # Decision cache small enough to evict all the time
+CHECK_CACHE_SCENARIO = 'open_field'          # Scenario whose neighbourhoods repeat, so the cache also hits
+
+# Modes besides the update_grid engines; the tiled and stacked ones don't take a guide
+MODE_SPARSE = 'sparse'
+MODE_TILED = 'tiled'
+MODE_STACKED = 'stacked'
+GUIDED_MODES = (ENGINE_NUMPY, ENGINE_JIT, ENGINE_LOOKUP, MODE_SPARSE)
+UNGUIDED_MODES = GUIDED_MODES + (MODE_TILED, MODE_STACKED)
+
+
+def run_mode(grid, mode, steps=CHECK_STEPS, seed=CHECK_SEED, guide=None):
+    """
+    Steps a copy of the grid with an engine (see dsa_automaton.update_grid) or mode,
+    guided by a new guide of the given class if any, and returns the grid of every step.
+    """
+    grid = grid.copy()
+    frontier = guide(grid) if guide is not None else None
+    random.seed(seed)
+    grids = []
+    if mode == MODE_SPARSE:
+        swarm = SparseSwarm(grid, frontier)
+        for iter_count in range(steps):
+            grids.append(swarm.step(iter_count).copy())
+    elif mode == MODE_TILED:
+        with TiledSwarm(grid, CHECK_PROCESSES) as swarm:
+            for iter_count in range(steps):
+                grids.append(swarm.step(iter_count).copy())
+    elif mode == MODE_STACKED:
+        # Two copies of the grid with the same stream give the same result each
+        stacked = np.stack((grid, grid))
+        rngs = [random.Random(seed), random.Random(seed)]
+        for iter_count in range(steps):
+            stacked = update_grids(stacked, rngs, iter_count)
+            if not np.array_equal(stacked[0], stacked[1]):
+                raise AssertionError(f'Stacked scenarios differ after step {iter_count}')
+            grids.append(stacked[0].copy())
+    else:
+        if mode == ENGINE_LOOKUP:
+            DECISION_CACHE.clear()
+        coverage = CoverageCounter(grid)
+        for iter_count in range(steps):
+            grid = update_grid(grid, iter_count, engine=mode, coverage=coverage, frontier=frontier)
+            grids.append(grid)
+    return grids
+
+
+def check_engines(scenarios=CHECK_SCENARIOS, size=CHECK_SIZE, steps=CHECK_STEPS, seed=CHECK_SEED):
+    """
+    Steps every scenario with the loop engine and with every other engine and mode,
+    without a guide and with each guide, and compares their grids after every step:
+    all of them have to follow the loop engine exactly for a fixed seed.
+    Prints and returns the mismatches as (scenario, guide, mode, first differing step).
+    """
+    mismatches = []
+    for scenario in scenarios:
+        grid = make_scenario(scenario, size)
+        for guide, modes in ((None, UNGUIDED_MODES), (FrontierIndex, GUIDED_MODES), (GradientField, GUIDED_MODES)):
+            guide_name = guide.__name__ if guide is not None else 'no guide'
+            expected = run_mode(grid, ENGINE_LOOP, steps, seed, guide)
+            for mode in modes:
+                grids = run_mode(grid, mode, steps, seed, guide)
+                step = next((i for i, (a, b) in enumerate(zip(expected, grids)) if not np.array_equal(a, b)), None)
+                if step is not None:
+                    print(f'{scenario}, {guide_name}: {mode} differs from {ENGINE_LOOP} after step {step}')
+                    mismatches.append((scenario, guide_name, mode, step))
+    if not mismatches:
+        print(f'All engines and modes match {ENGINE_LOOP} over {steps} steps of {", ".join(scenarios)}')
+    return mismatches
+
+
+def check_no_drones(scenario=CHECK_SCENARIOS[0], size=CHECK_SIZE, steps=3, seed=CHECK_SEED):
+    """
+    Steps the scenario without any drone, the state of a run once all of them are
+    removed, with every guided engine and mode and each guide. Prints and returns the failures.
+    """
+    obstacles, drones = scenario_maps(scenario, size)
+    grid = assemble_grid(obstacles, np.zeros_like(drones))
+    failures = []
+    for guide in (FrontierIndex, GradientField):
+        for mode in (ENGINE_LOOP,) + GUIDED_MODES:
+            try:
+                grids = run_mode(grid, mode, steps, seed, guide)
+            except Exception as error:
+                failures.append(f'{scenario} without drones, {guide.__name__}: {mode} fails: {error!r}')
+                continue
+            if not np.array_equal(grids[-1][..., :L_GRAD], grid[..., :L_GRAD]):
+                failures.append(f'{scenario} without drones, {guide.__name__}: {mode} changes the grid')
+    for failure in failures:
+        print(failure)
+    if not failures:
+        print(f'All guided engines and modes step {scenario} without drones')
+    return failures
+
+
+def check_decision_cache(scenario=CHECK_CACHE_SCENARIO, size=CHECK_SIZE, steps=CHECK_STEPS, seed=CHECK_SEED,
+                         capacity=CHECK_CACHE_SIZE):
+    """
+    Steps the scenario with the lookup engine and a cache of the given capacity,
+    which fills up and evicts all the time, and compares its grids with the loop
+    engine's; also stores more new neighbourhoods at once than the cache holds
+    in use, which has to evict all of them. Prints and returns the failures.
+    """
+    failures = []
+    cache = DecisionCache(capacity)
+    # Three neighbourhoods in use, then more new ones than free rows at once
+    rows = {'writes': np.zeros(capacity, dtype=bool)}
+    cache.store(list(range(3)), {field: values[:3] for field, values in rows.items()})
+    try:
+        cache.store(list(range(3, capacity + 1)), {field: values[:capacity - 2] for field, values in rows.items()})
+    except ValueError as error:
+        failures.append(f'Storing past a partly used cache fails: {error}')
+
+    grid = make_scenario(scenario, size)
+    expected = run_mode(grid, ENGINE_LOOP, steps, seed)
+    cache = DecisionCache(capacity)
+    random.seed(seed)
+    coverage = CoverageCounter(grid)
+    for iter_count in range(steps):
+        grid = update_grid_lookup(grid, iter_count, coverage, cache=cache)
+        if not np.array_equal(grid, expected[iter_count]):
+            failures.append(f'{scenario}: lookup with a cache of {capacity} differs from {ENGINE_LOOP} '
+                            f'after step {iter_count}')
+            break
+    for failure in failures:
+        print(failure)
+    if not failures:
+        print(f'Lookup with a cache of {capacity} matches {ENGINE_LOOP} over {steps} steps of {scenario}, '
+              f'{cache.hit_rate * 100:.1f}% hit rate')
+    return failures
+
+
+if __name__ == '__main__':
+    failed = check_engines()
+    failed += check_no_drones()
+    failed += check_decision_cache()
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,159 @@
+import numpy as np
+from dsa_automaton import BIG_ZONE_R, PAD, L_VIS, V_UNVISITED
+
+# Frontier index parameters
+FRONTIER_BLOCK = 8  # Side of the blocks of the finest level, in cells
+
+# The 3x3 neighbourhood of a block, searched at every level
+NEIGHBOURS = [(dx, dy) for dx in range(-1, 1+1) for dy in range(-1, 1+1)]
+
+
+def pool_counts(level):
+    """Next coarser level: every block sums a 2x2 square of the given level."""
+    width, height = level.shape
+    padded = np.zeros((width + width % 2, height + height % 2), dtype=level.dtype)
+    padded[:width, :height] = level
+    return padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2).sum(axis=(1, 3))
+
+
+# Padded coordinates of the cells of the drones' big zones, ordered as in gather_zones
+def zone_cells(px, py):
+    offsets = np.arange(-BIG_ZONE_R, BIG_ZONE_R+1)
+    ox, oy = np.meshgrid(offsets, offsets, indexing='ij')
+    return (px[:, None, None] + ox).ravel(), (py[:, None, None] + oy).ravel()
+
+
+class FrontierIndex:
+    """
+    Pyramid of unvisited cell counts over L_VIS: the finest level counts the
+    unvisited cells of every block of FRONTIER_BLOCK x FRONTIER_BLOCK cells,
+    every coarser level sums 2x2 blocks of the one below, up to a single block.
+    Engines keep it up to date with the cells they write, in O(changed cells),
+    and ask it for the direction of the nearest block that still has unvisited cells.
+    It ignores obstacles, so drones only follow it once they can't keep their heading.
+    """
+
+    keeps_heading = True
+
+    def __init__(self, grid, block=FRONTIER_BLOCK):
+        grid_w, grid_h = grid.shape[0] - 2*PAD, grid.shape[1] - 2*PAD
+        self.block = block
+        self.grid_w, self.grid_h = grid_w, grid_h
+        blocks_w, blocks_h = -(-grid_w // block), -(-grid_h // block)
+        unvisited = np.zeros((blocks_w * block, blocks_h * block), dtype=np.int64)
+        unvisited[:grid_w, :grid_h] = grid[PAD:PAD+grid_w, PAD:PAD+grid_h, L_VIS] == V_UNVISITED
+        self.levels = [unvisited.reshape(blocks_w, block, blocks_h, block).sum(axis=(1, 3))]
+        while self.levels[-1].size > 1:
+            self.levels.append(pool_counts(self.levels[-1]))
+
+    @property
+    def unvisited(self):
+        return int(self.levels[-1].sum())
+
+    def record(self, grid, cx, cy, old_values):
+        """
+        Accounts for L_VIS cells (cx, cy), in padded coordinates, changed from old_values
+        to their values in grid. Cells may repeat, as long as they repeat the same values.
+        """
+        new_values = grid[cx, cy, L_VIS]
+        inside = (cx >= PAD) & (cx < PAD+self.grid_w) & (cy >= PAD) & (cy < PAD+self.grid_h)
+        delta = ((new_values == V_UNVISITED).astype(np.int64) -
+                 (old_values == V_UNVISITED).astype(np.int64))
+        changed = inside & (delta != 0)
+        cx, cy, delta = cx[changed] - PAD, cy[changed] - PAD, delta[changed]
+        _, first = np.unique(cx.astype(np.int64) * self.grid_h + cy, return_index=True)
+        bx, by, delta = cx[first] // self.block, cy[first] // self.block, delta[first]
+        for level in self.levels:
+            np.add.at(level, (bx, by), delta)
+            bx, by = bx // 2, by // 2
+
+    def record_zones(self, px, py, old_grid, new_grid):
+        """Accounts for the big zones of the drones (px, py) written from old_grid into new_grid."""
+        zone_x, zone_y = zone_cells(px, py)
+        self.record(new_grid, zone_x, zone_y, old_grid[zone_x, zone_y, L_VIS])
+
+    def directions(self, grid, px, py):
+        """
+        Directions (-1, 0 or 1 along each axis) from the drones (px, py), in padded
+        coordinates, to the nearest block with unvisited cells: the nearest one around
+        the drone at the finest level that has any, then the nearest of its sub-blocks
+        down to the finest level. (0, 0) if no unvisited cell is left.
+        """
+        x = (px - PAD).astype(np.int64)
+        y = (py - PAD).astype(np.int64)
+        count = x.shape[0]
+        if not count:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        target_level = np.full(count, -1)
+        target_x = np.zeros(count, dtype=np.int64)
+        target_y = np.zeros(count, dtype=np.int64)
+
+        # Up the pyramid, until some neighbouring block has unvisited cells
+        for l, level in enumerate(self.levels):
+            searching = np.flatnonzero(target_level < 0)
+            if not searching.shape[0]:
+                break
+            size = self.block << l
+            best_distance = np.full(searching.shape[0], np.inf)
+            for dx, dy in NEIGHBOURS:
+                nx = x[searching] // size + dx
+                ny = y[searching] // size + dy
+                valid = (nx >= 0) & (nx < level.shape[0]) & (ny >= 0) & (ny < level.shape[1])
+                nonempty = valid & (level[np.clip(nx, 0, level.shape[0]-1), np.clip(ny, 0, level.shape[1]-1)] > 0)
+                distance = self.distance(x[searching], y[searching], nx, ny, size)
+                better = nonempty & (distance < best_distance)
+                best_distance[better] = distance[better]
+                target_x[searching[better]] = nx[better]
+                target_y[searching[better]] = ny[better]
+            found = searching[np.isfinite(best_distance)]
+            target_level[found] = l
+
+        # Down the pyramid, into the nearest sub-block that has unvisited cells
+        for l in range(len(self.levels) - 1, 0, -1):
+            descending = np.flatnonzero(target_level == l)
+            if not descending.shape[0]:
+                continue
+            level = self.levels[l-1]
+            size = self.block << (l-1)
+            best_distance = np.full(descending.shape[0], np.inf)
+            best_x = np.zeros(descending.shape[0], dtype=np.int64)
+            best_y = np.zeros(descending.shape[0], dtype=np.int64)
+            for dx in range(2):
+                for dy in range(2):
+                    nx = target_x[descending] * 2 + dx
+                    ny = target_y[descending] * 2 + dy
+                    valid = (nx < level.shape[0]) & (ny < level.shape[1])
+                    nonempty = valid & (level[np.minimum(nx, level.shape[0]-1),
+                                              np.minimum(ny, level.shape[1]-1)] > 0)
+                    distance = self.distance(x[descending], y[descending], nx, ny, size)
+                    better = nonempty & (distance < best_distance)
+                    best_distance[better] = distance[better]
+                    best_x[better] = nx[better]
+                    best_y[better] = ny[better]
+            target_x[descending] = best_x
+            target_y[descending] = best_y
+            target_level[descending] = l - 1
+
+        # Direction to the nearest unvisited cell of the target block, in one of 8 directions
+        offsets = np.arange(self.block)
+        shape = (count, self.block, self.block)
+        cells_x = np.broadcast_to(np.minimum(target_x[:, None, None] * self.block + offsets[None, :, None],
+                                             self.grid_w - 1), shape)
+        cells_y = np.broadcast_to(np.minimum(target_y[:, None, None] * self.block + offsets[None, None, :],
+                                             self.grid_h - 1), shape)
+        unvisited = grid[cells_x + PAD, cells_y + PAD, L_VIS] == V_UNVISITED
+        distance = np.where(unvisited, (cells_x - x[:, None, None])**2 + (cells_y - y[:, None, None])**2, np.inf)
+        nearest = distance.reshape(count, -1).argmin(axis=1)
+        offset_x = cells_x.reshape(count, -1)[np.arange(count), nearest] - x
+        offset_y = cells_y.reshape(count, -1)[np.arange(count), nearest] - y
+        gx = np.where(2 * np.abs(offset_x) >= np.abs(offset_y), np.sign(offset_x), 0).astype(int)
+        gy = np.where(2 * np.abs(offset_y) >= np.abs(offset_x), np.sign(offset_y), 0).astype(int)
+        none = target_level < 0
+        gx[none] = 0
+        gy[none] = 0
+        return gx, gy
+
+    # Squared distances from cells (x, y) to the centers of blocks (bx, by) of the given size
+    @staticmethod
+    def distance(x, y, bx, by, size):
+        return (bx * size + (size - 1) / 2 - x) ** 2 + (by * size + (size - 1) / 2 - y) ** 2
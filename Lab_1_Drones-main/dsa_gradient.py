@@ -0,0 +1,144 @@
+import numpy as np
+from dsa_automaton import L_OBST, L_VIS, L_GRAD, V_UNVISITED
+from dsa_frontier import NEIGHBOURS, zone_cells
+
+# Gradient layer values: cells with a path to an unvisited cell hold 1 + distance % 3,
+# so the neighbours one step closer always hold 1 + (value + 1) % 3 and drones
+# can follow the field downhill from L_GRAD alone, whatever the distance
+G_NONE = 0       # Obstacle, or no unvisited cell can be reached from here
+G_CYCLE = 3      # Distances are stored modulo this many values
+NO_PATH = np.iinfo(np.int32).max  # Distance of cells without a path
+
+
+class GradientField:
+    """
+    Distance from every free cell to the nearest unvisited cell, in drone moves
+    (8 directions, around obstacles), stored in L_GRAD of the grid. Engines keep
+    it up to date with the cells they write, like dsa_frontier.FrontierIndex:
+    cells only ever get visited, so distances only grow, and only where the
+    nearest unvisited cell was just visited; those cells are cleared and filled
+    again from their neighbours instead of searching the whole map every step.
+    Drones that gain nothing nearby follow it downhill, see directions(), even
+    before their heading: it leads around obstacles, out of dead ends.
+    """
+
+    keeps_heading = False
+
+    def __init__(self, grid):
+        grid_wp, grid_hp = grid.shape[:2]
+        self.offsets = np.array([dx * grid_hp + dy for dx, dy in NEIGHBOURS if dx or dy])
+        self.free = (grid[..., L_OBST] == 0).ravel()
+        self.distance = np.full(grid_wp * grid_hp, NO_PATH, dtype=np.int32)
+        # Unvisited cell every distance is measured to; cells without a path have -1
+        self.source = np.full(grid_wp * grid_hp, -1, dtype=np.int64)
+        self.invalid = np.zeros(grid_wp * grid_hp, dtype=bool)
+        # Scratch space of distinct(), as big as the grid, so that it never sorts
+        self.slot = np.zeros(grid_wp * grid_hp, dtype=np.int64)
+
+        sources = np.flatnonzero((grid[..., L_VIS] == V_UNVISITED).ravel() & self.free)
+        self.distance[sources] = 0
+        self.source[sources] = sources
+        self.fill(sources)
+        grid[..., L_GRAD] = self.values(np.arange(grid_wp * grid_hp)).reshape(grid_wp, grid_hp)
+
+    def values(self, cells):
+        """L_GRAD values of the given flat cells."""
+        distance = self.distance[cells]
+        return np.where(distance == NO_PATH, G_NONE, 1 + distance % G_CYCLE)
+
+    def distinct(self, cells):
+        """Positions of the last occurrences of the flat cells, in their order."""
+        positions = np.arange(cells.shape[0])
+        self.slot[cells] = positions
+        return positions[self.slot[cells] == positions]
+
+    def neighbours(self, cells):
+        """Free 8-neighbours of the given flat cells, with the cell each was reached from."""
+        around = (cells[:, None] + self.offsets).ravel()
+        parents = np.repeat(cells, self.offsets.shape[0])
+        free = self.free[around]
+        return around[free], parents[free]
+
+    def fill(self, seeds):
+        """
+        Distances of the cells without a path, grown from the seeds, which
+        already have theirs: a breadth-first search one distance at a time,
+        where seeds join the search once it gets to their distance.
+        """
+        seeds = seeds[np.argsort(self.distance[seeds], kind='stable')]
+        seed_distance = self.distance[seeds]
+        first = 0
+        current = seeds[:0]
+        distance = seed_distance[0] if seeds.shape[0] else 0
+        while first < seeds.shape[0] or current.shape[0]:
+            if not current.shape[0]:
+                distance = seed_distance[first]
+            last = np.searchsorted(seed_distance, distance, side='right')
+            current = np.concatenate((current, seeds[first:last]))
+            first = last
+
+            around, parents = self.neighbours(current)
+            reached = self.distance[around] == NO_PATH
+            around, parents = around[reached], parents[reached]
+            index = self.distinct(around)
+            around = around[index]
+            self.distance[around] = distance + 1
+            self.source[around] = self.source[parents[index]]
+            current = around
+            distance += 1
+
+    def record(self, grid, cx, cy, old_values):
+        """
+        Accounts for L_VIS cells (cx, cy), in padded coordinates, changed from old_values
+        to their values in grid, and writes the changed distances into its L_GRAD.
+        """
+        grid_hp = grid.shape[1]
+        visited = (old_values == V_UNVISITED) & (grid[cx, cy, L_VIS] != V_UNVISITED)
+        removed = np.unique(cx[visited].astype(np.int64) * grid_hp + cy[visited])
+        removed = removed[self.distance[removed] == 0]
+        if not removed.shape[0]:
+            return
+
+        # Cells measured to the visited ones are reached from them through
+        # cells measured to the same ones, so clearing spreads from them
+        self.invalid[removed] = True
+        cleared = [removed]
+        current = removed
+        while current.shape[0]:
+            self.distance[current] = NO_PATH
+            around, _ = self.neighbours(current)
+            around = around[self.distinct(around)]
+            owner = self.source[around]
+            current = around[(self.distance[around] != NO_PATH) & (owner >= 0) & self.invalid[np.maximum(owner, 0)]]
+            cleared.append(current)
+        cleared = np.concatenate(cleared)
+        self.invalid[removed] = False
+        self.source[cleared] = -1
+
+        # Cleared cells get their distances again from the cells around them that kept theirs
+        around, _ = self.neighbours(cleared)
+        seeds = around[self.distinct(around)]
+        self.fill(seeds[self.distance[seeds] != NO_PATH])
+        grid[cleared // grid_hp, cleared % grid_hp, L_GRAD] = self.values(cleared)
+
+    def record_zones(self, px, py, old_grid, new_grid):
+        """Accounts for the big zones of the drones (px, py) written from old_grid into new_grid."""
+        zone_x, zone_y = zone_cells(px, py)
+        self.record(new_grid, zone_x, zone_y, old_grid[zone_x, zone_y, L_VIS])
+
+    def directions(self, grid, px, py):
+        """
+        Directions (-1, 0 or 1 along each axis) downhill from the drones (px, py),
+        in padded coordinates: the sum of the moves to the neighbours closer to
+        an unvisited cell, read from L_GRAD. (0, 0) where there's no path.
+        """
+        value = grid[px, py, L_GRAD].astype(int)
+        downhill = 1 + (value + 1) % G_CYCLE
+        gx = np.zeros(px.shape[0], dtype=int)
+        gy = np.zeros(px.shape[0], dtype=int)
+        for dx, dy in NEIGHBOURS:
+            if dx or dy:
+                closer = (value != G_NONE) & (grid[px + dx, py + dy, L_GRAD] == downhill)
+                gx += dx * closer
+                gy += dy * closer
+        return np.sign(gx), np.sign(gy)
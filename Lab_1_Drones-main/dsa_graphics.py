@@ -1,26 +1,17 @@
-from PIL import Image, ImageDraw
+import numpy as np
 import pygame
-from dsa_automaton import GRID_H, GRID_W, PAD
-from dsa_automaton import DR_HERE, DR_NEAR, DR_NONE, DR_VECT
 from dsa_automaton import V_VISITED, V_UNVISITED
-from dsa_automaton import L_OBST, L_DRON, L_VIS
+from dsa_automaton import L_VIS
+# The colours are still importable from here, where they used to be defined
+from dsa_colors import COLOR_OBST, COLOR_NO_OBST, COLOR_DRONE, COLOR_DR_PR1, COLOR_DR_PR2
+from dsa_colors import COLOR_DR_NEAR, COLOR_DR_VECT, COLOR_VISIT, COLOR_NO_VISIT, COLOR_UNREACHABLE
+from dsa_colors import PALETTE, grid_codes
 
 # Visualization parameters
 CELL_SIZE = 6   # Cell size in pixels
 FPS = 20        # Screen update frequency limit
 
-COLOR_OBST = (0, 0, 0)          # Black: color for obstacle
-COLOR_NO_OBST = (255, 255, 255) # White: color for no obstacle; for initialization
-
-COLOR_DRONE = (0, 0, 205)       # Blue: drone is in this cell
-COLOR_DR_PR1 = (100,149,237)    # Dimmer blue: drone was last turn
-COLOR_DR_PR2 = (135,206,250)    # Even dimmer blue: drone was here 2 turns ago
-COLOR_DR_NEAR = (255, 0, 0)     # Red: drone can move here
-COLOR_DR_VECT = (64, 224, 208)  # Bright blue: drone is going there
-
-COLOR_VISIT = (50,205,50)        # This cell has been visited
-COLOR_NO_VISIT = (255,165,0)     # This cell hasn't been visited
-COLOR_UNREACHABLE = (255,99,71)  # This cell is unreachable
+DIRTY_TILE = 16  # Changed cells are sent to the display in tiles of this many cells
 
 
 # Initialize Pygame
@@ -32,63 +23,74 @@ def init_pygame(grid_w, grid_h) -> pygame.Surface:
     return screen
 
 
-# Helper function
-def draw_cell(screen, x, y, color):
-    pygame.draw.rect(screen, color, pygame.Rect(
-                x * CELL_SIZE, 
-                y * CELL_SIZE, 
-                CELL_SIZE, 
-                CELL_SIZE
-            ))
+# Visualization: the grid is coloured in one vectorized pass, blitted as
+# a scaled surface, and only the tiles with changed cells are updated
+def draw_grid(screen, new_grid, old_grid=None):
+    codes = grid_codes(new_grid)
+    if codes is None:
+        return None
+    # Screen x runs along the second grid axis
+    image = PALETTE[codes].transpose(1, 0, 2)
+    surface = pygame.surfarray.make_surface(image)
+    screen.blit(pygame.transform.scale(surface, (image.shape[0] * CELL_SIZE, image.shape[1] * CELL_SIZE)), (0, 0))
 
+    if old_grid is None:
+        pygame.display.flip()
+        return 1
 
-# Visualization
-def draw_grid(screen, new_grid, old_grid=None):
-    for x in range(GRID_W):
-        for y in range(GRID_H):
-            obst, drone, visit, _, _, _ = new_grid[PAD+y, PAD+x, :]
-            if old_grid is not None:
-                _, drone_old, visit_old, _, _, _ = old_grid[PAD+y, PAD+x, :]
-                # If nothing changed, skip this cell
-                if drone == drone_old and visit == visit_old:
-                    continue
-            # 1. If cell contains obstacle - no need to draw anything else
-            if obst:
-                draw_cell(screen, x, y, COLOR_OBST)
-                continue
-            # 2. If cell contains drone or drone-related information:
-            if drone != DR_NONE:
-                if drone == DR_HERE:
-                    # Drone is in this cell
-                    draw_cell(screen, x, y, COLOR_DRONE)
-                elif drone == DR_NEAR:
-                    # This cell is near a drone
-                    draw_cell(screen, x, y, COLOR_DR_NEAR)
-                elif drone == DR_VECT:
-                    # This cell is drone's vector point
-                    draw_cell(screen, x, y, COLOR_DR_VECT)
-                else:
-                    # Unexprected value
-                    print(f'Unexpected value in drone layer: {drone} at {x}, {y}')
-                    return None
-                continue
-            # 3. In other cases, draw the visit value of the cell
-            if visit == V_VISITED:
-                draw_cell(screen, x, y, COLOR_VISIT)
-            elif visit == V_UNVISITED:
-                draw_cell(screen, x, y, COLOR_NO_VISIT)
-            else:
-                draw_cell(screen, x, y, COLOR_UNREACHABLE)
-    # Update screen
-    pygame.display.flip()
+    old_codes = grid_codes(old_grid)
+    if old_codes is None:
+        pygame.display.flip()
+        return 1
+    changed = (codes != old_codes).T
+    tiles_x = -(-changed.shape[0] // DIRTY_TILE)
+    tiles_y = -(-changed.shape[1] // DIRTY_TILE)
+    padded = np.zeros((tiles_x * DIRTY_TILE, tiles_y * DIRTY_TILE), dtype=bool)
+    padded[:changed.shape[0], :changed.shape[1]] = changed
+    dirty = padded.reshape(tiles_x, DIRTY_TILE, tiles_y, DIRTY_TILE).any(axis=(1, 3))
+    tile_size = DIRTY_TILE * CELL_SIZE
+    pygame.display.update([pygame.Rect(tx * tile_size, ty * tile_size, tile_size, tile_size)
+                           for tx, ty in np.argwhere(dirty)])
     return 1
 
 
-# Report progress via window title
-def observer(new_grid, old_grid, iter_count):
-    np_visit = new_grid[:, :, L_VIS]
-    unvisited_count = (np_visit == V_UNVISITED).sum()
-    visited_count = (np_visit == V_VISITED).sum()
+# Report progress via window title; with a CoverageCounter, the grid isn't scanned
+def observer(new_grid, old_grid, iter_count, coverage=None):
+    if coverage is not None:
+        unvisited_count = coverage.unvisited
+        visited_count = coverage.visited
+    else:
+        np_visit = new_grid[:, :, L_VIS]
+        unvisited_count = (np_visit == V_UNVISITED).sum()
+        visited_count = (np_visit == V_VISITED).sum()
     visited_share = visited_count / (visited_count + unvisited_count)
     pygame.display.set_caption(f'CA-Based Drone Swarm Simulation: {visited_share * 100.0:.2f}% (iter. {iter_count})')
 
+
+
+# Display loop of a simulation running elsewhere (see dsa_runner.AsyncSimulation): the latest
+# snapshot is drawn at most fps times a second and the ones published in between are skipped,
+# so the simulation never waits for the screen. Closing the window stops the simulation.
+# Returns the total number of iterations of the simulation.
+def display_simulation(simulation, fps=FPS):
+    screen = init_pygame(simulation.grid_w, simulation.grid_h)
+    clock = pygame.time.Clock()
+    shown = old_grid = None
+    done = False
+    while not done:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                simulation.stop()
+        # Once the worker is found gone, its final snapshot is already published
+        running = simulation.running
+        snapshot = simulation.latest(shown)
+        if snapshot is not None:
+            draw_grid(screen, snapshot.grid, old_grid)
+            observer(snapshot.grid, old_grid, snapshot.iter_count, snapshot.coverage)
+            # The grid drawn last is compared against next time; two arrays take turns
+            old_grid, shown = snapshot.grid, old_grid
+            done = snapshot.done
+        elif not running:
+            done = True
+        clock.tick(fps)
+    return simulation.join()
@@ -0,0 +1,117 @@
+import numpy as np
+from dsa_automaton import SimulationConfig, init_grid, update_grid, collision_layers
+from dsa_automaton import ENGINE_LOOP, L_OBST, L_DRON, L_VIS, L_GRAD, L_COLL1, L_COLL2
+from dsa_automaton import DR_NONE, DR_NEAR, DR_VECT, DR_HERE, V_UNREACHABLE, V_UNVISITED, V_VISITED
+
+# Packed cell state: one byte per cell, the drone value code in bits 0-1
+# and the visit value code in bits 2-3
+DRONE_VALUES = (DR_NONE, DR_NEAR, DR_VECT, DR_HERE)
+VISIT_VALUES = (V_UNREACHABLE, V_UNVISITED, V_VISITED)
+DRONE_MASK = 0b11
+VISIT_SHIFT = 2
+NO_CODE = 255
+
+# Codes of the values, indexed by the value as an unsigned byte
+DRONE_CODES = np.full(256, NO_CODE, dtype=np.uint8)
+DRONE_CODES[np.array(DRONE_VALUES, dtype=np.int16) % 256] = np.arange(len(DRONE_VALUES))
+VISIT_CODES = np.full(256, NO_CODE, dtype=np.uint8)
+VISIT_CODES[np.array(VISIT_VALUES, dtype=np.int16) % 256] = np.arange(len(VISIT_VALUES))
+
+
+def value_codes(layer, codes, values, name):
+    """Codes of all values of a layer; ValueError on a value that has none."""
+    layer_codes = codes[layer.astype(np.uint8)]
+    unknown = layer_codes == NO_CODE
+    if unknown.any():
+        x, y = np.argwhere(unknown)[0]
+        raise ValueError(f'Problem with cell {name} value: {int(layer[x, y])} at {x}, {y}, '
+                         f'expected one of {values}')
+    return layer_codes
+
+
+class SwarmGrid:
+    """
+    Padded grid that carries its own configuration and keeps its layers packed:
+    obstacles as a bitmask, drone and visit values as 2-bit codes sharing one byte,
+    L_COLL1/L_COLL2 rebuilt from coordinates, and L_GRAD only while it isn't all zeros.
+    That's 1.125 bytes per cell instead of 6, so many more grids fit in memory;
+    unpack() gives the usual (H, W, L) array that all engines work on.
+    """
+
+    def __init__(self, grid, config=None):
+        if config is None:
+            config = SimulationConfig.from_grid(grid)
+        if grid.shape != config.padded_shape:
+            raise ValueError(f'Grid of shape {grid.shape} does not match {config}')
+        self.config = config
+        self.pack(grid)
+
+    @classmethod
+    def from_config(cls, config=None):
+        """New grid built by init_grid from the bitmaps of the config."""
+        if config is None:
+            config = SimulationConfig()
+        return cls(init_grid(config), config)
+
+    @property
+    def shape(self):
+        return self.config.padded_shape
+
+    @property
+    def grid_w(self):
+        return self.config.grid_w
+
+    @property
+    def grid_h(self):
+        return self.config.grid_h
+
+    @property
+    def nbytes(self):
+        """Memory taken by the packed layers."""
+        grads = 0 if self.grads is None else self.grads.nbytes
+        return self.obstacles.nbytes + self.state.nbytes + grads
+
+    def pack(self, grid):
+        """Stores the layers of a full grid of this geometry."""
+        grid_wp, grid_hp = grid.shape[:2]
+        coll1, coll2 = collision_layers(grid_wp, grid_hp, grid.dtype)
+        if not (np.array_equal(grid[..., L_COLL1], coll1) and np.array_equal(grid[..., L_COLL2], coll2)):
+            raise ValueError('Collision avoidance layers differ from the coordinate parity planes')
+        obstacles = grid[..., L_OBST]
+        if not np.isin(obstacles, (0, 1)).all():
+            raise ValueError('Obstacle layer holds values other than 0 and 1')
+
+        drone_codes = value_codes(grid[..., L_DRON], DRONE_CODES, DRONE_VALUES, 'drone')
+        visit_codes = value_codes(grid[..., L_VIS], VISIT_CODES, VISIT_VALUES, 'visit')
+        self.obstacles = np.packbits(obstacles.astype(bool), axis=None)
+        self.state = drone_codes | (visit_codes << VISIT_SHIFT)
+        grads = grid[..., L_GRAD]
+        self.grads = grads.copy() if grads.any() else None
+
+    def unpack(self):
+        """Full padded (H, W, L) grid."""
+        grid_wp, grid_hp, layers = self.shape
+        cell_type = self.config.cell_type
+        grid = np.empty(self.shape, dtype=cell_type)
+        grid[..., L_OBST] = np.unpackbits(self.obstacles, count=grid_wp * grid_hp).reshape(grid_wp, grid_hp)
+        grid[..., L_DRON] = np.array(DRONE_VALUES, dtype=cell_type)[self.state & DRONE_MASK]
+        grid[..., L_VIS] = np.array(VISIT_VALUES, dtype=cell_type)[self.state >> VISIT_SHIFT]
+        grid[..., L_GRAD] = 0 if self.grads is None else self.grads
+        grid[..., L_COLL1], grid[..., L_COLL2] = collision_layers(grid_wp, grid_hp, cell_type)
+        return grid
+
+    def progress(self):
+        """Same percentage as calculate_progress, from the packed visit codes."""
+        counts = np.bincount((self.state >> VISIT_SHIFT).ravel(), minlength=len(VISIT_VALUES))
+        visited = counts[VISIT_VALUES.index(V_VISITED)]
+        return visited / (visited + counts[VISIT_VALUES.index(V_UNVISITED)]) * 100
+
+    def step(self, iter_count=0, engine=ENGINE_LOOP, coverage=None):
+        """
+        Advances the grid by one step with the given engine and packs the result.
+        Returns the full new grid, or None (and keeps the old one) on an engine problem.
+        """
+        new_grid = update_grid(self.unpack(), iter_count, engine=engine, coverage=coverage)
+        if new_grid is not None:
+            self.pack(new_grid)
+        return new_grid
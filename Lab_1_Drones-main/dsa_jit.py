@@ -0,0 +1,382 @@
+import random
+import numpy as np
+from dsa_automaton import BIG_ZONE_R, DRONE_VIS_R, PAD
+from dsa_automaton import L_OBST, L_DRON, L_VIS, L_COLL1, L_COLL2
+from dsa_automaton import DR_HERE, DR_NONE, DR_NEAR, DR_VECT
+from dsa_automaton import V_VISITED, V_UNVISITED, V_UNREACHABLE
+from dsa_vectorized import drone_marks, stale_drone_marks, guided_moves
+
+# Numba is optional: without it, dsa_automaton.update_grid keeps using the loop engine
+try:
+    import numba
+except ImportError:
+    numba = None
+
+JIT_AVAILABLE = numba is not None
+
+# Moves are encoded as indices 0..8 of the 3x3 surrounding, in the same order
+# as the loop engine enumerates them (dx outer, dy inner); 4 is standing still
+MOVE_STAY = 4
+
+# Per-drone decision flags
+F_WRITES = 1  # Drone has at least one move and writes its big zone back
+F_REMOVE = 2  # Drone is removed from the grid
+F_STUCK = 4   # Drone has no free cell to move to
+F_CHOOSE = 8  # Move is a random choice among the candidates
+F_INSIDE = 16 # Drone is inside an obstacle
+F_THRUST = 32 # Drone thrusts away from another drone
+F_PRIORITY = 64  # Drone picks among the moves that gain the most unvisited cells
+
+
+def jit(func):
+    if numba is None:
+        return func
+    return numba.njit(cache=True)(func)
+
+
+@jit
+def move_index(dx, dy):
+    return (dx + 1) * 3 + (dy + 1)
+
+
+@jit
+def keep_only(possible, index):
+    for k in range(9):
+        possible[k] = False
+    possible[index] = True
+
+
+# Unvisited cells around (tx, ty), once the drone at (px, py) has marked its own surrounding
+@jit
+def unvisited_count(grid, px, py, tx, ty):
+    count = 0
+    for x in range(tx-1, tx+2):
+        for y in range(ty-1, ty+2):
+            if abs(x - px) <= DRONE_VIS_R and abs(y - py) <= DRONE_VIS_R:
+                continue
+            if grid[x, y, L_VIS] == V_UNVISITED:
+                count += 1
+    return count
+
+
+# Steps I.1 to II of the loop engine, for every drone.
+# Every drone gets the list of its move candidates, the move it keeps
+# if it doesn't choose at random, and its decision flags
+@jit
+def decide_drones(grid, xs, ys, candidates, heading, flags):
+    for i in range(xs.shape[0]):
+        px = xs[i]
+        py = ys[i]
+        possible = candidates[i]
+        flags[i] = 0
+        heading[i] = MOVE_STAY
+
+        # What was the previous cell? It's the one with DR_NONE
+        has_prev = False
+        prev_x = 1
+        prev_y = 1
+        for dx in range(-1, 1+1):
+            for dy in range(-1, 1+1):
+                if not has_prev and grid[px+dx, py+dy, L_DRON] == DR_NONE:
+                    has_prev = True
+                    prev_x = dx
+                    prev_y = dy
+
+        # 1. Exclude obstacles and cells occupied by other drones
+        any_move = False
+        for k in range(9):
+            dx = k // 3 - 1
+            dy = k % 3 - 1
+            possible[k] = (k != MOVE_STAY and grid[px+dx, py+dy, L_OBST] == 0
+                           and grid[px+dx, py+dy, L_DRON] != DR_HERE)
+            any_move = any_move or possible[k]
+        if not any_move:
+            continue
+        flags[i] |= F_WRITES
+
+        # 2. Exclude moves that could get the drone too close to another drone
+        remove = False
+        thrust = False
+        for dx in range(-BIG_ZONE_R, BIG_ZONE_R+1):
+            for dy in range(-BIG_ZONE_R, BIG_ZONE_R+1):
+                if remove or thrust:
+                    break
+                collision_val = grid[px+dx, py+dy, L_DRON]
+                if -1 <= dx <= 1 and -1 <= dy <= 1:
+                    if dx == 0 and dy == 0:
+                        continue
+                    if collision_val == DR_HERE:
+                        keep_only(possible, move_index(-dx, -dy))
+                        thrust = True
+                        if abs(dx) != abs(dy):
+                            removal_flag = grid[px, py, L_COLL1]
+                        else:
+                            removal_flag = grid[px, py, L_COLL2]
+                        if removal_flag:
+                            keep_only(possible, MOVE_STAY)
+                            remove = True
+                elif collision_val == DR_NEAR:
+                    for k in range(9):
+                        if ((dx == BIG_ZONE_R and k // 3 == 2) or
+                                (dx == -BIG_ZONE_R and k // 3 == 0) or
+                                (dy == BIG_ZONE_R and k % 3 == 2) or
+                                (dy == -BIG_ZONE_R and k % 3 == 0)):
+                            possible[k] = False
+                elif (collision_val == DR_VECT or collision_val == DR_HERE) and dx != -prev_x and dy != -prev_y:
+                    half_dx = dx // 2 if abs(dx) > 1 else dx
+                    half_dy = dy // 2 if abs(dy) > 1 else dy
+                    keep_only(possible, move_index(-half_dx, -half_dy))
+                    thrust = True
+
+        if thrust:
+            flags[i] |= F_THRUST
+
+        count = 0
+        single = MOVE_STAY
+        for k in range(9):
+            if possible[k]:
+                count += 1
+                single = k
+        if count == 0:
+            possible[MOVE_STAY] = True
+            count = 1
+            single = MOVE_STAY
+
+        # If drone is already stuck inside an obstacle - remove it
+        if grid[px, py, L_OBST]:
+            remove = True
+            flags[i] |= F_INSIDE
+        if remove:
+            flags[i] |= F_REMOVE
+
+        # If drone is thrusting into an obstacle - just stop
+        if count == 1 and grid[px + single // 3 - 1, py + single % 3 - 1, L_OBST]:
+            keep_only(possible, MOVE_STAY)
+
+        # Final cleanup of possible moves: is there anywhere to go at all?
+        stuck = True
+        for k in range(9):
+            if not possible[k] or k == MOVE_STAY:
+                continue
+            tx = px + k // 3 - 1
+            ty = py + k % 3 - 1
+            drone = grid[tx, ty, L_DRON]
+            if grid[tx, ty, L_OBST] == 0 and drone != DR_HERE and drone != DR_VECT:
+                stuck = False
+        if stuck:
+            flags[i] |= F_STUCK
+
+        # 3. Unvisited cells take more priority
+        max_cells_count = 0
+        if count != 1:
+            for k in range(9):
+                if possible[k]:
+                    cells_count = unvisited_count(grid, px, py, px + k // 3 - 1, py + k % 3 - 1)
+                    if cells_count > max_cells_count:
+                        max_cells_count = cells_count
+        if max_cells_count > 0:
+            # Pick any move that leads to the best result
+            for k in range(9):
+                if possible[k]:
+                    possible[k] = unvisited_count(grid, px, py,
+                                                  px + k // 3 - 1, py + k % 3 - 1) == max_cells_count
+            flags[i] |= F_CHOOSE | F_PRIORITY
+        elif has_prev and possible[move_index(-prev_x, -prev_y)]:
+            # Continue moving in the same direction
+            heading[i] = move_index(-prev_x, -prev_y)
+        else:
+            flags[i] |= F_CHOOSE
+
+
+# The scan of the loop engine: stale DR_NEAR/DR_VECT cells are cleared and
+# every drone writes its modified big zone back, in the same order.
+# Changes of the L_VIS counts (unreachable, unvisited, visited) are added to visit_delta.
+# Returns the flat index of a cell with an unexpected drone value, or -1
+@jit
+def write_back(grid, new_grid, candidates, heading, flags, picks, zone_drones, zone_visit, visit_delta):
+    grid_w = grid.shape[0] - 2*PAD
+    grid_h = grid.shape[1] - 2*PAD
+    c = BIG_ZONE_R
+    i = -1
+    for x in range(grid_w):
+        for y in range(grid_h):
+            px = PAD + x
+            py = PAD + y
+            cell_drone_val = grid[px, py, L_DRON]
+            if cell_drone_val == DR_NONE:
+                continue
+
+            if cell_drone_val == DR_NEAR or cell_drone_val == DR_VECT:
+                drone_near = False
+                for dx in range(-1, 1+1):
+                    for dy in range(-1, 1+1):
+                        if grid[px+dx, py+dy, L_VIS] == V_UNREACHABLE:
+                            continue
+                        if grid[px+dx, py+dy, L_DRON] == DR_HERE:
+                            drone_near = True
+                if not drone_near:
+                    new_grid[px, py, L_DRON] = DR_NONE
+                continue
+
+            if cell_drone_val != DR_HERE:
+                return x * grid_h + y
+
+            i += 1
+            if not flags[i] & F_WRITES:
+                continue
+
+            move = heading[i]
+            if flags[i] & F_CHOOSE:
+                rank = -1
+                for k in range(9):
+                    if candidates[i, k]:
+                        rank += 1
+                        if rank == picks[i]:
+                            move = k
+                            break
+            mov_dx = move // 3 - 1
+            mov_dy = move % 3 - 1
+
+            for zx in range(2*BIG_ZONE_R+1):
+                for zy in range(2*BIG_ZONE_R+1):
+                    zone_drones[zx, zy] = grid[px-c+zx, py-c+zy, L_DRON]
+                    zone_visit[zx, zy] = grid[px-c+zx, py-c+zy, L_VIS]
+
+            # Drone visits cells within its visit radius, including its own cell
+            for vx in range(-DRONE_VIS_R, DRONE_VIS_R+1):
+                for vy in range(-DRONE_VIS_R, DRONE_VIS_R+1):
+                    zone_visit[c+vx, c+vy] = V_VISITED
+
+            stuck = flags[i] & F_STUCK
+            if not flags[i] & F_REMOVE:
+                # 1. Drone's nearest cells (DR_NEAR) aren't these anymore
+                for dx in range(-1, 1+1):
+                    for dy in range(-1, 1+1):
+                        if dx == 0 and dy == 0:
+                            continue
+                        drone = zone_drones[c+dx, c+dy]
+                        if drone == DR_NEAR or drone == DR_VECT or (stuck and drone == DR_HERE):
+                            zone_drones[c+dx, c+dy] = DR_NONE
+
+                # Bit of a hack: if stuck, remove all foreign vector points
+                if stuck:
+                    for dx in range(-BIG_ZONE_R, BIG_ZONE_R+1):
+                        for dy in range(-BIG_ZONE_R, BIG_ZONE_R+1):
+                            if -1 <= dx <= 1 and -1 <= dy <= 1:
+                                continue
+                            drone = zone_drones[c+dx, c+dy]
+                            if drone == DR_VECT or drone == DR_NEAR:
+                                zone_drones[c+dx, c+dy] = DR_NONE
+
+                # 2. Drone is now in a different cell
+                new_x = c + mov_dx
+                new_y = c + mov_dy
+                if (new_x != c or new_y != c) and zone_drones[new_x, new_y] == DR_HERE:
+                    new_x = c
+                    new_y = c
+                zone_drones[new_x, new_y] = DR_HERE
+
+                # 3. Drone's nearest cells are now these ones
+                for dx in range(-1, 1+1):
+                    for dy in range(-1, 1+1):
+                        drone = zone_drones[new_x+dx, new_y+dy]
+                        if drone == DR_NONE or drone == DR_VECT:
+                            zone_drones[new_x+dx, new_y+dy] = DR_NEAR
+
+                # 4. Drone isn't in its old cell anymore
+                if new_x != c or new_y != c:
+                    zone_drones[c, c] = DR_NONE
+
+                # 5. Drone's vector point is new
+                drone = zone_drones[new_x+mov_dx, new_y+mov_dy]
+                if drone == DR_NONE or drone == DR_NEAR:
+                    zone_drones[new_x+mov_dx, new_y+mov_dy] = DR_VECT
+            else:
+                # Remove this drone and its additional information
+                for dx in range(-1, 1+1):
+                    for dy in range(-1, 1+1):
+                        if dx == 0 and dy == 0:
+                            continue
+                        drone = zone_drones[c+dx, c+dy]
+                        if drone == DR_NEAR or drone == DR_VECT:
+                            zone_drones[c+dx, c+dy] = DR_NONE
+                zone_drones[c, c] = DR_NONE
+
+            #    III. Update grid
+            for zx in range(2*BIG_ZONE_R+1):
+                for zy in range(2*BIG_ZONE_R+1):
+                    new_grid[px-c+zx, py-c+zy, L_DRON] = zone_drones[zx, zy]
+                    visit_delta[new_grid[px-c+zx, py-c+zy, L_VIS] - V_UNREACHABLE] -= 1
+                    visit_delta[zone_visit[zx, zy] - V_UNREACHABLE] += 1
+                    new_grid[px-c+zx, py-c+zy, L_VIS] = zone_visit[zx, zy]
+    return -1
+
+
+# Counts decisions the way the loop engine does, from the flags of the drones
+def count_flags(profiler, flags):
+    writes = (flags & F_WRITES) != 0
+    remove = (flags & F_REMOVE) != 0
+    profiler.count('drones', flags.shape[0])
+    profiler.count('thrust_away', (writes & ((flags & F_THRUST) != 0)).sum())
+    profiler.count('removed', (writes & remove).sum())
+    profiler.count('stuck', (writes & ~remove & ((flags & F_STUCK) != 0)).sum())
+
+
+# Same update as dsa_automaton.update_grid, with the per-drone logic compiled
+def update_grid_jit(grid, iter_count=0, coverage=None, profiler=None, frontier=None):
+    grid_w, grid_h = grid.shape[0] - 2*PAD, grid.shape[1] - 2*PAD
+    xs, ys = np.nonzero(grid[PAD:PAD+grid_w, PAD:PAD+grid_h, L_DRON] == DR_HERE)
+    drone_count = xs.shape[0]
+    candidates = np.empty((drone_count, 9), dtype=np.bool_)
+    heading = np.empty(drone_count, dtype=np.int64)
+    flags = np.empty(drone_count, dtype=np.int64)
+    decide_drones(grid, xs + PAD, ys + PAD, candidates, heading, flags)
+
+    for i in np.flatnonzero(flags & F_INSIDE):
+        print(f'{iter_count}. Drone at {xs[i]},{ys[i]} is inside an obstacle - removing it')
+
+    # Drones that gain nothing nearby choose among the moves towards the nearest
+    # unvisited cell instead of a random move, and instead of their heading
+    # unless the guide keeps it
+    if frontier is not None:
+        aligned, guided = guided_moves(candidates, *frontier.directions(grid, xs + PAD, ys + PAD))
+        guided &= (flags & F_PRIORITY) == 0
+        if frontier.keeps_heading:
+            guided &= (flags & F_CHOOSE) != 0
+        candidates[guided] = aligned[guided]
+        flags[guided] |= F_CHOOSE
+
+    # Random picks are drawn from the module-level random, in scan order,
+    # so that the result is the same as the loop engine's
+    picks = np.full(drone_count, -1, dtype=np.int64)
+    choosers = np.flatnonzero(((flags & F_WRITES) != 0) & ((flags & F_CHOOSE) != 0))
+    picks[choosers] = [random.choice(range(n)) for n in candidates[choosers].sum(axis=1).tolist()]
+    if profiler is not None:
+        profiler.lap('decide')
+
+    new_grid = grid.copy()
+    zone_drones = np.empty((2*BIG_ZONE_R+1, 2*BIG_ZONE_R+1), dtype=grid.dtype)
+    zone_visit = np.empty_like(zone_drones)
+    visit_delta = np.zeros(3, dtype=np.int64)
+    problem = write_back(grid, new_grid, candidates, heading, flags, picks,
+                         zone_drones, zone_visit, visit_delta)
+    if problem >= 0:
+        x, y = divmod(problem, grid_h)
+        print(f'Problem with cell drone value: {grid[PAD+x, PAD+y, L_DRON]} at {x}, {y}')
+        return None
+    if coverage is not None:
+        coverage.counts += visit_delta
+    if frontier is not None:
+        writes = (flags & F_WRITES) != 0
+        frontier.record_zones(xs[writes] + PAD, ys[writes] + PAD, grid, new_grid)
+    if profiler is not None:
+        # Moves are applied within the write-back scan
+        profiler.lap('write')
+        count_flags(profiler, flags)
+        # The kernel doesn't count its cleanup; the marks are found again instead,
+        # unless the profiler doesn't keep these counts
+        if 'marks_checked' in profiler.counters or 'marks_cleared' in profiler.counters:
+            mx, my = drone_marks(grid)
+            profiler.count('marks_checked', mx.shape[0])
+            profiler.count('marks_cleared', stale_drone_marks(grid, mx, my)[0].shape[0])
+    return new_grid
@@ -0,0 +1,215 @@
+import numpy as np
+from dsa_automaton import BIG_ZONE_R, L_OBST, L_DRON, L_VIS, L_COLL1, L_COLL2
+from dsa_grid import DRONE_CODES, VISIT_CODES, DRONE_VALUES, VISIT_VALUES, NO_CODE
+from dsa_vectorized import decide_moves, update_grid_vectorized, ZONE_C
+
+# Lookup parameters
+LOOKUP_CACHE_SIZE = 1 << 16  # Neighbourhoods remembered, at most
+EVICT_SHARE = 8              # A full cache forgets this share of them at once
+
+# Zone key encoding: every cell of the big zone is one digit of a number in base CELL_CODES,
+# the low word of the key also holds the center's collision bits and the guide direction
+CELL_CODES = 2 * len(VISIT_VALUES) * len(DRONE_VALUES)  # Obstacle bit, visit and drone codes
+ZONE_CELLS = (2*BIG_ZONE_R + 1) ** 2
+HIGH_CELLS = 13                # Cells in the high word: 24**13 < 2**60
+NO_DIRECTION = 9               # Direction code of drones without a guide
+DIRECTION_CODES = NO_DIRECTION + 1
+CELL_WEIGHTS = np.uint64(CELL_CODES) ** np.arange(HIGH_CELLS - 1, -1, -1).astype(np.uint64)
+
+# Per-drone decision fields kept for every neighbourhood, see dsa_vectorized.decide_moves
+ROW_FIELDS = ('np_drones', 'np_visit', 'writes', 'remove', 'stuck', 'thrust', 'move', 'candidates', 'inside')
+
+
+def zone_keys(zones, directions=None, keeps_heading=True):
+    """
+    Integer keys of the big zones: equal for zones that lead to the same decisions.
+    Returns them as a (drones, 2) array of words, and which zones have one
+    (zones with values the encoding doesn't know are decided every time).
+    """
+    count = zones.shape[0]
+    obstacles = (zones[..., L_OBST] != 0).reshape(count, ZONE_CELLS)
+    drones = np.take(DRONE_CODES, zones[..., L_DRON].view(np.uint8)).reshape(count, ZONE_CELLS)
+    visits = np.take(VISIT_CODES, zones[..., L_VIS].view(np.uint8)).reshape(count, ZONE_CELLS)
+    known = ((drones != NO_CODE) & (visits != NO_CODE)).all(axis=1)
+    codes = ((obstacles * np.uint8(len(VISIT_VALUES)) + visits) * np.uint8(len(DRONE_VALUES)) + drones).astype(np.uint64)
+    codes[~known] = 0
+
+    words = np.empty((count, 2), dtype=np.uint64)
+    words[:, 0] = codes[:, :HIGH_CELLS] @ CELL_WEIGHTS
+    words[:, 1] = codes[:, HIGH_CELLS:] @ CELL_WEIGHTS[HIGH_CELLS - ZONE_CELLS:]
+    if directions is None:
+        direction = np.full(count, NO_DIRECTION)
+    else:
+        direction = (directions[0] + 1) * 3 + (directions[1] + 1)
+    low = ((zones[:, ZONE_C, ZONE_C, L_COLL1] != 0) * 2 + (zones[:, ZONE_C, ZONE_C, L_COLL2] != 0)
+           + 4 * (direction + DIRECTION_CODES * bool(keeps_heading)))
+    words[:, 1] = words[:, 1] * np.uint64(8 * DIRECTION_CODES) + low.astype(np.uint64)
+    return words, known
+
+
+def distinct_keys(words, known):
+    """
+    Distinct keys among the known zones, the first zone of each, and the index
+    of its key for every zone (0 for the unknown ones): np.unique of the rows,
+    but sorting the two words as numbers rather than as bytes.
+    """
+    zones = np.flatnonzero(known)
+    order = zones[np.lexsort((words[zones, 1], words[zones, 0]))]
+    sorted_words = words[order]
+    starts = np.ones(order.shape[0], dtype=bool)
+    starts[1:] = (sorted_words[1:] != sorted_words[:-1]).any(axis=1)
+    key_index = np.cumsum(starts) - 1
+    rows = np.zeros(words.shape[0], dtype=np.int64)
+    rows[order] = key_index
+    # The sort is stable, so every run of equal keys starts with its first zone
+    return sorted_words[starts], order[starts], rows
+
+
+class DecisionCache:
+    """
+    Move decisions of dsa_vectorized.decide_moves, memoized per neighbourhood.
+    A decision depends only on the big zone of the drone, the collision bits of its
+    cell and its guide direction, so drones in a configuration seen before take
+    their candidate moves, heading and zone changes from a table instead of the rules.
+    Random picks among the candidates are still drawn for every drone, as usual.
+    Once capacity neighbourhoods are remembered, the least recently used
+    1/EVICT_SHARE of them are forgotten to make room.
+    """
+
+    def __init__(self, capacity=LOOKUP_CACHE_SIZE):
+        self.capacity = capacity
+        self.clear()
+
+    def clear(self):
+        """Forgets all neighbourhoods and resets the hit counts."""
+        capacity = self.capacity
+        self.slots = {}                       # Key -> row of the table
+        self.keys = [None] * capacity         # Row of the table -> key
+        self.free = list(range(capacity - 1, -1, -1))
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self.clock = 0
+        self.table = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        """Share of drone decisions taken from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def print_stats(self):
+        print(f'Decision cache: {self.hits} hits, {self.misses} misses ({self.hit_rate * 100:.1f}% hit rate), '
+              f'{len(self.slots)} of {self.capacity} neighbourhoods remembered')
+
+    def allocate(self, rows):
+        """Table of the remembered rows, shaped after the first rows decided."""
+        self.table = {field: np.zeros((self.capacity,) + values.shape[1:], dtype=values.dtype)
+                      for field, values in rows.items()}
+
+    def lookup(self, keys):
+        """Rows of the table holding the keys, -1 for the keys it doesn't have."""
+        get = self.slots.get
+        slots = np.array([get(key, -1) for key in keys], dtype=np.int64)
+        self.clock += 1
+        self.last_used[slots[slots >= 0]] = self.clock
+        return slots
+
+    def evict(self, count):
+        """Forgets the count least recently used neighbourhoods (all of them, if there are fewer)."""
+        used = np.flatnonzero(np.array([key is not None for key in self.keys]))
+        count = min(count, used.shape[0])
+        if not count:
+            return
+        evicted = used[np.argpartition(self.last_used[used], count - 1)[:count]].tolist()
+        for slot in evicted:
+            del self.slots[self.keys[slot]]
+            self.keys[slot] = None
+        self.free.extend(evicted)
+
+    def store(self, keys, rows):
+        """Remembers the rows of decisions of the given keys."""
+        if self.table is None:
+            self.allocate(rows)
+        # Beyond capacity, the first keys would only push each other out
+        skipped = max(len(keys) - self.capacity, 0)
+        keys = keys[skipped:]
+        if len(keys) > len(self.free):
+            # Forgetting a share of the table at once keeps this off the per-step path
+            self.evict(max(len(keys) - len(self.free), self.capacity // EVICT_SHARE))
+        slots = [self.free.pop() for _ in keys]
+        self.slots.update(zip(keys, slots))
+        for slot, key in zip(slots, keys):
+            self.keys[slot] = key
+        self.last_used[slots] = self.clock
+        for field, values in rows.items():
+            self.table[field][slots] = values[skipped:]
+
+    def decide(self, zones, iter_count=0, coords=None, directions=None, keeps_heading=True):
+        """Same decisions as dsa_vectorized.decide_moves, from the cache where possible."""
+        count = zones.shape[0]
+        words, known = zone_keys(zones, directions, keeps_heading)
+        unique_words, first, drone_rows = distinct_keys(words, known)
+        keys = [(high << 64) | low for high, low in unique_words.tolist()]
+
+        # Every distinct neighbourhood is looked up once, but counts for all of its drones
+        slots = self.lookup(keys)
+        hit = slots >= 0
+        uses = np.bincount(drone_rows[known], minlength=len(keys))
+        self.hits += int(uses[hit].sum())
+        self.misses += count - int(uses[hit].sum())
+
+        # Neighbourhoods seen for the first time and zones without a key go through the rules
+        missed = np.flatnonzero(~hit)
+        unknown = np.flatnonzero(~known)
+        decided = np.concatenate((first[missed], unknown))
+        decided_directions = None if directions is None else (directions[0][decided], directions[1][decided])
+        computed = decision_rows(decide_moves(zones[decided], iter_count, None, decided_directions, keeps_heading))
+        new_rows = {field: values[:missed.shape[0]] for field, values in computed.items()}
+        unknown_rows = {field: values[missed.shape[0]:] for field, values in computed.items()}
+        if self.table is not None:
+            cached_rows = {field: self.table[field][slots[hit]] for field in self.table}
+        self.store([keys[i] for i in missed.tolist()], new_rows)
+
+        # Rows of the distinct neighbourhoods, then of every drone
+        decisions = {}
+        for field, values in new_rows.items():
+            rows = np.empty((len(keys),) + values.shape[1:], dtype=values.dtype)
+            rows[missed] = values
+            if hit.any():
+                rows[hit] = cached_rows[field]
+            decisions[field] = np.empty((count,) + values.shape[1:], dtype=values.dtype)
+            decisions[field][known] = rows[drone_rows[known]]
+            decisions[field][unknown] = unknown_rows[field]
+
+        if coords is not None:
+            for i in np.flatnonzero(decisions['inside']):
+                print(f'{iter_count}. Drone at {coords[0][i]},{coords[1][i]} is inside an obstacle - removing it')
+        choosers = np.flatnonzero(decisions.pop('chooser'))
+        decisions['choosers'] = choosers
+        decisions['choice_counts'] = decisions['candidates'][choosers].sum(axis=1)
+        return decisions
+
+
+# Per-drone rows of the decisions of decide_moves: its fields, and whether the drone picks at random
+def decision_rows(decisions):
+    rows = {field: decisions[field] for field in ROW_FIELDS}
+    rows['chooser'] = np.zeros(decisions['writes'].shape[0], dtype=bool)
+    rows['chooser'][decisions['choosers']] = True
+    return rows
+
+
+# Cache shared by all steps of the lookup engine
+DECISION_CACHE = DecisionCache()
+
+
+# Same update as dsa_automaton.update_grid, with the decisions memoized in DECISION_CACHE
+# (or the given cache); DECISION_CACHE.print_stats() shows how often they repeat
+def update_grid_lookup(grid, iter_count=0, coverage=None, profiler=None, frontier=None, cache=None):
+    if cache is None:
+        cache = DECISION_CACHE
+    return update_grid_vectorized(grid, iter_count, coverage, profiler, frontier, decide=cache.decide)
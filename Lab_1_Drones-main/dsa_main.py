@@ -1,45 +1,126 @@
 import pygame
 from dsa_graphics import init_pygame, draw_grid, observer, FPS
-from dsa_automaton import init_grid, update_grid, GRID_W, GRID_H
+from dsa_automaton import init_grid, update_grid, calculate_progress, CoverageCounter, ENGINE_LOOP
+from dsa_checkpoint import load_checkpoint
+from dsa_stopping import StoppingRule, mean_confidence_interval, precise_enough, CONFIDENCE, MIN_SIMULATIONS
 
 
-def calculate_progress(grid):
-    """Calculates the percentage of the operational area that has been visited."""
-    visit_layer = grid[:, :, 2]  # Visit layer (L_VIS)
-    visited_cells = (visit_layer == 1).sum()  # Number of visited cells
-    total_cells = (visit_layer != -1).sum()  # Total number of cells excluding obstacles
-    return (visited_cells / total_cells) * 100
-
-
-def run_simulation_until_threshold(threshold=75):
+def run_simulation_until_threshold(threshold=75, engine=ENGINE_LOOP, checkpointer=None, config=None,
+                                   profiler=None, stopping=None, on_step=None, on_end=None, guide=None):
     """
     Runs the simulation until the specified progress threshold (75%) is reached.
+    The grid is updated by the given engine (see dsa_automaton.update_grid).
+    With a dsa_checkpoint.Checkpointer, checkpoints are saved along the way.
+    The map comes from a dsa_automaton.SimulationConfig, the default one without it.
+    With a dsa_profile.StepProfiler, every step is timed and counted.
+    A dsa_stopping.StoppingRule (by default, one that only detects stalls)
+    ends runs that can't or shouldn't get there; its reason tells why.
+    on_step and on_end are called as in continue_simulation, and so is the guide.
     Returns the number of iterations to achieve the progress.
     """
-    grid = init_grid()
-    iter_count = 0
+    grid = init_grid(config)
+    return continue_simulation(grid, 0, threshold, engine, checkpointer, profiler, stopping, on_step, on_end,
+                               guide)
+
+
+def continue_simulation(grid, iter_count, threshold=75, engine=ENGINE_LOOP, checkpointer=None, profiler=None,
+                        stopping=None, on_step=None, on_end=None, guide=None):
+    """
+    Runs the simulation from the given grid and iteration until the threshold is reached,
+    or the dsa_stopping.StoppingRule (by default, one that only detects stalls) stops it.
+    With a dsa_checkpoint.Checkpointer, checkpoints are saved along the way.
+    on_step is called after every step and on_end once the run is over, both with
+    the grid, the iteration count and the dsa_automaton.CoverageCounter.
+    A guide, e.g. dsa_gradient.GradientField or dsa_frontier.FrontierIndex, is built
+    for the run from its grid and steers the drones that gain nothing nearby.
+    Returns the total number of iterations. Whether the threshold was reached tells
+    the reason of the given rule (None if it was); without a rule, an early stop is printed.
+    """
+    # Guides are built first: GradientField fills L_GRAD of the grid
+    frontier = guide(grid) if guide is not None else None
+    coverage = CoverageCounter(grid)
+    report_stop = stopping is None
+    if stopping is None:
+        stopping = StoppingRule()
+    stopping.start(iter_count)
 
-    while calculate_progress(grid) < threshold:
-        grid = update_grid(grid, iter_count)
-        iter_count += 1
+    try:
+        while coverage.progress() < threshold:
+            if stopping.should_stop(grid, iter_count, coverage.progress()):
+                break
+            if checkpointer is not None:
+                checkpointer.maybe_save(grid, iter_count)
+            grid = update_grid(grid, iter_count, engine=engine, coverage=coverage, profiler=profiler,
+                               frontier=frontier)
+            iter_count += 1
+            if on_step is not None:
+                on_step(grid, iter_count, coverage)
+        if on_end is not None:
+            on_end(grid, iter_count, coverage)
+    finally:
+        if checkpointer is not None:
+            checkpointer.close()
 
+    if report_stop and stopping.reason is not None:
+        print(f"Run stopped before the threshold ({stopping.reason}) after {iter_count} iterations, "
+              f"{coverage.progress():.2f}% coverage")
     return iter_count
 
 
-def run_multiple_simulations(simulation_count=10, threshold=75):
+def resume_simulation(path, threshold=75, engine=ENGINE_LOOP, checkpointer=None, stopping=None, guide=None):
+    """
+    Continues a simulation from a checkpoint file, with the module-level random
+    restored, so that it goes on exactly as the interrupted run would have
+    (with the same guide as the interrupted run, which is rebuilt from the grid).
+    Returns the total number of iterations, as continue_simulation.
+    """
+    grid, iter_count = load_checkpoint(path)
+    return continue_simulation(grid, iter_count, threshold, engine, checkpointer, stopping=stopping, guide=guide)
+
+
+def run_multiple_simulations(simulation_count=10, threshold=75, engine=ENGINE_LOOP, config=None,
+                             stopping=None, precision=None, confidence=CONFIDENCE,
+                             min_simulations=MIN_SIMULATIONS, metrics=None, guide=None):
     """
     Runs multiple simulations and calculates statistics.
     Measures the number of iterations in each simulation and prints the results to the terminal.
+    Runs stopped by the dsa_stopping.StoppingRule are counted, but left out of the statistics.
+    With a precision, e.g. 0.05, no more trials are started (simulation_count is then
+    the maximum) once the confidence interval of the mean number of iterations
+    is within +-5% of the mean.
+    A dsa_metrics.MetricsObserver streams summaries of every run while it goes.
+    Every run gets a new guide, if any (see continue_simulation).
+    Returns the numbers of iterations of the runs that reached the threshold.
     """
+    if stopping is None:
+        stopping = StoppingRule()
     results = []
+    stopped = {}
 
     for _ in range(simulation_count):
-        steps = run_simulation_until_threshold(threshold)
-        results.append(steps)
+        steps = run_simulation_until_threshold(threshold, engine, config=config, stopping=stopping,
+                                               on_step=metrics,
+                                               on_end=metrics.finish if metrics is not None else None,
+                                               guide=guide)
+        if stopping.reason is None:
+            results.append(steps)
+        else:
+            stopped[stopping.reason] = stopped.get(stopping.reason, 0) + 1
+        if precision is not None and precise_enough(results, precision, confidence, min_simulations):
+            break
 
+    for reason, count in stopped.items():
+        print(f"Runs stopped before the threshold ({reason}): {count}")
+    if not results:
+        print("No run reached the threshold")
+        return results
+    mean, half_width = mean_confidence_interval(results, confidence)
     print("Minimum Number of Iterations:", min(results))
     print("Maximum Number of Iterations:", max(results))
     print("Average Number of Iterations:", sum(results) / len(results))
+    print(f"{confidence:.0%} Confidence Interval of the Average: {mean - half_width:.1f} .. "
+          f"{mean + half_width:.1f} ({len(results)} runs)")
+    return results
 
 
 if __name__ == '__main__':
@@ -0,0 +1,193 @@
+import collections
+import http.server
+import json
+import os
+import threading
+import time
+from dsa_automaton import L_DRON, DR_HERE
+
+# Metrics parameters
+METRICS_INTERVAL = 0.1          # Seconds between summaries handed to the sinks, at least
+METRICS_HOST = '127.0.0.1'      # The metrics endpoint only listens locally by default
+METRICS_PORT = 9108             # Port of the metrics endpoint (0 picks a free one)
+JSONL_MAX_BYTES = 16 * 1024**2  # A JSON-lines file is rotated once it grows past this size...
+JSONL_BACKUPS = 5               # ...keeping this many older files: path.1 (newest) .. path.5
+
+# Per-step summary handed to the sinks: coverage in percent, visited and unvisited cells,
+# drones on the grid, mean wall time of the steps since the previous summary and
+# their rate, and the wall-clock time (time.time()) the summary was taken at
+StepSummary = collections.namedtuple(
+    'StepSummary', 'iteration coverage visited unvisited active_drones step_seconds steps_per_second timestamp')
+
+# Metrics of the endpoint: summary field, metric type and help text
+PROMETHEUS_METRICS = (
+    ('iteration', 'gauge', 'Iteration of the current run'),
+    ('coverage', 'gauge', 'Visited share of the reachable cells, in percent'),
+    ('visited', 'gauge', 'Visited cells'),
+    ('unvisited', 'gauge', 'Reachable cells not visited yet'),
+    ('active_drones', 'gauge', 'Drones on the grid'),
+    ('step_seconds', 'gauge', 'Mean wall time of the recent steps'),
+    ('steps_per_second', 'gauge', 'Steps simulated per second recently'),
+    ('timestamp', 'gauge', 'Unix time of the last summary'),
+)
+
+
+class MetricsObserver:
+    """
+    Streams summaries of a running simulation to pluggable sinks: any objects with
+    emit(summary), taking a StepSummary, and close(). It's called after every step,
+    continue_simulation(..., on_step=observer, on_end=observer.finish), but only
+    summarizes a step once interval seconds passed since the last summary, so that
+    a step it skips costs one clock read, however fast the simulation runs.
+    Step times are averaged over the steps in between, which therefore aren't timed;
+    the first call of a run only starts the clock, so one observer can follow run after run.
+    Summaries made elsewhere, e.g. per trial by dsa_batch, go to the sinks through publish().
+    """
+
+    def __init__(self, sinks, interval=METRICS_INTERVAL):
+        self.sinks = list(sinks)
+        self.interval = interval
+        self.last_time = time.perf_counter()
+        self.last_iteration = None
+        self.samples = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __call__(self, grid, iter_count, coverage):
+        if self.last_iteration is None:
+            self.last_time = time.perf_counter()
+            self.last_iteration = iter_count
+        elif time.perf_counter() - self.last_time >= self.interval:
+            self.sample(grid, iter_count, coverage)
+
+    def finish(self, grid, iter_count, coverage):
+        """Summarizes the last step of a run, unless the previous summary was of it."""
+        if iter_count != self.last_iteration:
+            self.sample(grid, iter_count, coverage)
+        # The next run starts its own clock
+        self.last_iteration = None
+
+    def sample(self, grid, iter_count, coverage):
+        now = time.perf_counter()
+        elapsed = now - self.last_time
+        # A run summarized before its first step is over has no earlier step to measure from
+        steps = iter_count - self.last_iteration if self.last_iteration is not None else 0
+        self.last_time = now
+        self.last_iteration = iter_count
+        summary = StepSummary(
+            iteration=iter_count,
+            coverage=coverage.progress(),
+            visited=int(coverage.visited),
+            unvisited=int(coverage.unvisited),
+            active_drones=int((grid[..., L_DRON] == DR_HERE).sum()),
+            step_seconds=elapsed / steps if steps > 0 else None,
+            steps_per_second=steps / elapsed if steps > 0 and elapsed > 0 else None,
+            timestamp=time.time(),
+        )
+        self.publish(summary)
+
+    def publish(self, summary):
+        """Hands a StepSummary to all sinks."""
+        self.samples += 1
+        for sink in self.sinks:
+            sink.emit(summary)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+class PrometheusSink:
+    """
+    Local HTTP endpoint serving the latest summary in the Prometheus text format
+    at /metrics, from a background thread. Metric names start with prefix;
+    port=0 picks a free port, which is kept in port.
+    """
+
+    def __init__(self, port=METRICS_PORT, host=METRICS_HOST, prefix='dsa_'):
+        self.prefix = prefix
+        self.latest = None
+        self.summaries = 0
+        sink = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = sink.exposition().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def emit(self, summary):
+        # A single reference swap, so the server thread never sees half a summary
+        self.latest = summary
+        self.summaries += 1
+
+    def exposition(self):
+        summary = self.latest
+        lines = [f'# HELP {self.prefix}summaries_total Summaries received',
+                 f'# TYPE {self.prefix}summaries_total counter',
+                 f'{self.prefix}summaries_total {self.summaries}']
+        if summary is not None:
+            for field, kind, text in PROMETHEUS_METRICS:
+                value = getattr(summary, field)
+                if value is None:
+                    continue
+                name = self.prefix + field + ('_total' if kind == 'counter' else '')
+                lines += [f'# HELP {name} {text}', f'# TYPE {name} {kind}', f'{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class JsonLinesSink:
+    """
+    Appends every summary as one JSON object per line to path. Once the file grows
+    past max_bytes, it's renamed to path.1 (older ones move up to path.2 and so on,
+    up to backups of them) and a new one is started.
+    """
+
+    def __init__(self, path, max_bytes=JSONL_MAX_BYTES, backups=JSONL_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def emit(self, summary):
+        self.file.write(json.dumps(summary._asdict()) + '\n')
+        self.file.flush()
+        if self.file.tell() >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        self.file.close()
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f'{self.path}.{index}'):
+                os.replace(f'{self.path}.{index}', f'{self.path}.{index + 1}')
+        if self.backups > 0:
+            os.replace(self.path, f'{self.path}.1')
+        else:
+            os.remove(self.path)
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def close(self):
+        self.file.close()
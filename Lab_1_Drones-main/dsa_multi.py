@@ -0,0 +1,81 @@
+import random
+import numpy as np
+from dsa_automaton import CoverageCounter, PAD, L_DRON, L_VIS, DR_HERE, DR_NONE, DR_NEAR, DR_VECT
+from dsa_automaton import V_VISITED, V_UNREACHABLE
+from dsa_vectorized import gather_zones, decide_and_move, stale_drone_marks, write_zones
+
+
+def stack_grids(grids):
+    """Stacks independent grids of the same shape into one (N, H, W, L) array."""
+    return np.stack(grids)
+
+
+def make_rngs(seeds):
+    """One independent random stream per scenario."""
+    return [random.Random(seed) for seed in seeds]
+
+
+def calculate_progress_batch(grids):
+    """Percentage of the visited operational area of every scenario, as an (N,) array."""
+    visit_layer = grids[..., L_VIS]
+    visited_cells = (visit_layer == V_VISITED).sum(axis=(1, 2))
+    total_cells = (visit_layer != V_UNREACHABLE).sum(axis=(1, 2))
+    return visited_cells / total_cells * 100
+
+
+def update_grids(grids, rngs, iter_count=0, active=None, coverage=None):
+    """
+    Advances all (active) scenarios of a stacked (N, H, W, L) array with one call.
+    Scenario n uses random stream rngs[n]; its result is the same as
+    dsa_automaton.update_grid with the module-level random in the state of rngs[n].
+    A stacked CoverageCounter, if given, is updated with the visited cells.
+    Returns the new stacked array, or None if some grid holds an unexpected drone value.
+    """
+    count, grid_hp, grid_wp, layers = grids.shape
+    interior = grids[:, PAD:grid_hp-PAD, PAD:grid_wp-PAD, L_DRON]
+    known = np.isin(interior, (DR_NONE, DR_NEAR, DR_VECT, DR_HERE))
+    if not known.all():
+        n, x, y = np.argwhere(~known)[0]
+        print(f'Problem with cell drone value: {int(interior[n, x, y])} at {x}, {y} (scenario {n})')
+        return None
+    if active is None:
+        active = np.ones(count, dtype=bool)
+
+    # Scenarios are stacked along x: each one keeps its own padding,
+    # so big zones and neighbourhoods never reach into another scenario
+    tall_grid = grids.reshape(count * grid_hp, grid_wp, layers)
+    new_grids = grids.copy()
+    new_tall_grid = new_grids.reshape(count * grid_hp, grid_wp, layers)
+
+    ns, xs, ys = np.nonzero((interior == DR_HERE) & active[:, None, None])
+    px, py = ns * grid_hp + xs + PAD, ys + PAD
+    zones = gather_zones(tall_grid, px, py)
+    np_drones, np_visit, writes = decide_and_move(zones, iter_count, (xs, ys),
+                                                  [rngs[n] for n in ns.tolist()])
+
+    ms, mx, my = np.nonzero(((interior == DR_NEAR) | (interior == DR_VECT)) & active[:, None, None])
+    sx, sy = stale_drone_marks(tall_grid, ms * grid_hp + mx + PAD, my + PAD)
+    write_zones(new_tall_grid, px[writes], py[writes], np_drones[writes], np_visit[writes],
+                sx, sy, coverage)
+    return new_grids
+
+
+def run_scenarios_until_threshold(grids, seeds, threshold=75):
+    """
+    Runs all stacked scenarios until each of them reaches the progress threshold.
+    A scenario stops as soon as it reaches the threshold, the others keep going.
+    Returns the number of iterations every scenario needed, as an (N,) array.
+    """
+    rngs = make_rngs(seeds)
+    coverage = CoverageCounter(grids, stacked=True)
+    iterations = np.zeros(grids.shape[0], dtype=int)
+    active = coverage.progress() < threshold
+    iter_count = 0
+
+    while active.any():
+        grids = update_grids(grids, rngs, iter_count, active, coverage)
+        iter_count += 1
+        iterations[active] = iter_count
+        active &= coverage.progress() < threshold
+
+    return iterations
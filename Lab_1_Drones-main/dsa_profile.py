@@ -0,0 +1,122 @@
+import csv
+import json
+import time
+
+# Per-step counters
+COUNTERS = (
+    'drones',         # Drones that made a decision
+    'thrust_away',    # Drones thrusting away from another drone
+    'removed',        # Drones removed from the grid
+    'stuck',          # Drones left without any free cell to move to
+    'marks_checked',  # DR_NEAR/DR_VECT cells checked for a drone nearby
+    'marks_cleared',  # Stale DR_NEAR/DR_VECT cells cleared
+)
+# Phases timed separately by the batched engines; the loop engine interleaves
+# them drone by drone, so it only has the time of the whole step
+PHASES = ('decide', 'move', 'write')
+FIELDS = ('iteration', 'engine', 'step_time') + tuple(f'{phase}_time' for phase in PHASES) + COUNTERS
+
+
+class StepProfiler:
+    """
+    Collects the wall time and counters of every step it's given to:
+    update_grid(..., profiler=profiler). Without a profiler, engines skip
+    all of this. Steps are kept as dictionaries with the keys of FIELDS
+    (phase times are None where an engine doesn't time them).
+    """
+
+    counters = COUNTERS
+
+    def __init__(self):
+        self.steps = []
+        self.current = None
+        self.start = self.lap_start = 0.0
+
+    def begin(self, iter_count, engine):
+        self.current = dict.fromkeys(FIELDS)
+        self.current.update(dict.fromkeys(COUNTERS, 0))
+        self.current['iteration'] = iter_count
+        self.current['engine'] = engine
+        self.start = self.lap_start = time.perf_counter()
+
+    def lap(self, phase):
+        """Ends the given phase of the current step."""
+        now = time.perf_counter()
+        self.current[f'{phase}_time'] = now - self.lap_start
+        self.lap_start = now
+
+    def count(self, counter, amount=1):
+        self.current[counter] += int(amount)
+
+    def end(self):
+        self.current['step_time'] = time.perf_counter() - self.start
+        self.steps.append(self.current)
+        self.current = None
+
+    def write_csv(self, path):
+        """Writes the time series, one row per step."""
+        with open(path, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(self.steps)
+
+    def write_json_lines(self, path):
+        """Writes the time series, one JSON object per step."""
+        with open(path, 'w') as file:
+            for step in self.steps:
+                file.write(json.dumps(step) + '\n')
+
+    def summary(self):
+        """Step count, total/mean/max step time, mean phase times and counter totals."""
+        step_times = [step['step_time'] for step in self.steps]
+        summary = {
+            'steps': len(self.steps),
+            'total_time': sum(step_times),
+            'mean_step_time': sum(step_times) / len(step_times) if step_times else None,
+            'max_step_time': max(step_times, default=None),
+        }
+        for phase in PHASES:
+            times = [step[f'{phase}_time'] for step in self.steps if step[f'{phase}_time'] is not None]
+            summary[f'mean_{phase}_time'] = sum(times) / len(times) if times else None
+        for counter in COUNTERS:
+            summary[counter] = sum(step[counter] for step in self.steps)
+        return summary
+
+    def print_summary(self):
+        summary = self.summary()
+        if not summary['steps']:
+            print('No steps profiled')
+            return
+        print(f"{summary['steps']} steps in {summary['total_time']:.3f} s, "
+              f"{summary['mean_step_time'] * 1000:.3f} ms per step on average, "
+              f"{summary['max_step_time'] * 1000:.3f} ms at most")
+        phases = [f"{phase} {summary[f'mean_{phase}_time'] * 1000:.3f} ms"
+                  for phase in PHASES if summary[f'mean_{phase}_time'] is not None]
+        if phases:
+            print('Mean phase times: ' + ', '.join(phases))
+        print(', '.join(f'{counter}: {summary[counter]}' for counter in COUNTERS))
+
+
+class StepCounter:
+    """
+    Totals of some of the counters of StepProfiler, for runs that only need those:
+    update_grid(..., profiler=counter) neither times the steps nor keeps them,
+    and engines skip the work of counters that aren't in counters.
+    """
+
+    def __init__(self, counters=COUNTERS):
+        self.counters = tuple(counters)
+        self.totals = dict.fromkeys(self.counters, 0)
+
+    def begin(self, iter_count, engine):
+        pass
+
+    def lap(self, phase):
+        pass
+
+    def count(self, counter, amount=1):
+        if counter in self.totals:
+            self.totals[counter] += int(amount)
+
+    def end(self):
+        pass
@@ -0,0 +1,123 @@
+import os
+import queue
+import threading
+import numpy as np
+from PIL import Image
+from dsa_colors import PALETTE, grid_codes
+
+# Recording parameters
+RECORD_EVERY = 1         # Record every n-th step
+RECORD_SCALE = 1.0       # Output pixels per grid cell
+RECORD_FPS = 20          # Playback speed of animated files
+RECORD_QUEUE_SIZE = 256  # Frames waiting for the writer thread, at most
+RECORD_GIF_SEGMENT = 500  # Frames per GIF file; longer recordings go on in numbered files
+
+
+class Recorder:
+    """
+    Headless replay recorder: turns grids into images with the dsa_graphics colour
+    scheme and writes them from a background thread, so the simulation loop never
+    waits for encoding. A path ending in .gif gives animated GIFs, any other path
+    is a directory for a PNG frame sequence. A GIF file is only written once all of its
+    frames are in, so frames are kept in memory until then: every gif_segment frames,
+    the GIF is written out and the recording goes on in the next file, run.gif
+    continuing in run_001.gif, run_002.gif and so on. When the writer falls behind and its
+    queue is full, frames are dropped (and counted) instead of blocking.
+    """
+
+    def __init__(self, path, every=RECORD_EVERY, scale=RECORD_SCALE,
+                 fps=RECORD_FPS, queue_size=RECORD_QUEUE_SIZE, gif_segment=RECORD_GIF_SEGMENT):
+        self.path = path
+        self.every = every
+        self.scale = scale
+        self.fps = fps
+        self.gif_segment = gif_segment
+        self.recorded_frames = 0
+        self.gif_files = 0
+        self.dropped_frames = 0
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.palette = PALETTE.ravel().tolist()
+        self.error = None
+        self.closed = False
+        if not path.lower().endswith('.gif'):
+            os.makedirs(path, exist_ok=True)
+        self.writer = threading.Thread(target=self.write_frames, daemon=True)
+        self.writer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record(self, grid, iter_count):
+        """Queues the grid of this step for writing, if it's one of the recorded steps."""
+        if iter_count % self.every:
+            return
+        codes = grid_codes(grid)
+        if codes is None:
+            return
+        try:
+            self.frames.put_nowait((iter_count, codes.astype(np.uint8)))
+            self.recorded_frames += 1
+        except queue.Full:
+            self.dropped_frames += 1
+
+    def close(self):
+        """Waits until all queued frames are written."""
+        if self.writer.is_alive():
+            self.frames.put(None)
+            self.writer.join()
+        if self.error is not None:
+            raise self.error
+
+    def to_image(self, codes):
+        # Image rows run along the first grid axis, as on the pygame screen
+        image = Image.fromarray(codes, mode='P')
+        image.putpalette(self.palette)
+        if self.scale != 1.0:
+            size = (max(1, round(codes.shape[1] * self.scale)), max(1, round(codes.shape[0] * self.scale)))
+            image = image.resize(size, Image.NEAREST)
+        return image
+
+    def gif_path(self, index):
+        """File of the index-th GIF segment: the path itself, then numbered ones next to it."""
+        if not index:
+            return self.path
+        root, extension = os.path.splitext(self.path)
+        return f'{root}_{index:03d}{extension}'
+
+    def save_gif(self, segment):
+        images = [self.to_image(codes) for codes in segment]
+        images[0].save(self.gif_path(self.gif_files), save_all=True, append_images=images[1:],
+                       duration=round(1000 / self.fps), loop=0)
+        self.gif_files += 1
+
+    def queued_frames(self):
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                self.closed = True
+                return
+            yield frame
+
+    def write_frames(self):
+        try:
+            if self.path.lower().endswith('.gif'):
+                segment = []
+                for _, codes in self.queued_frames():
+                    segment.append(codes)
+                    if len(segment) == self.gif_segment:
+                        self.save_gif(segment)
+                        segment = []
+                if segment:
+                    self.save_gif(segment)
+            else:
+                for iter_count, codes in self.queued_frames():
+                    self.to_image(codes).save(os.path.join(self.path, f'frame_{iter_count:06d}.png'))
+        except Exception as error:
+            self.error = error
+            # Keep draining, so that the simulation loop never blocks on a dead writer
+            if not self.closed:
+                for _ in self.queued_frames():
+                    pass
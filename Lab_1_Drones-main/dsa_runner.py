@@ -0,0 +1,215 @@
+import collections
+import copy
+import multiprocessing
+import random
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from dsa_graphics import display_simulation, FPS
+from dsa_automaton import SimulationConfig, init_grid, ENGINE_LOOP
+from dsa_main import continue_simulation
+from dsa_stopping import StoppingRule
+
+# Snapshot publishing parameters
+PUBLISH_INTERVAL = 0.02  # Seconds between published snapshots, at least (the last one always goes)
+
+# Snapshot header fields, int64 each, in front of the two grid slots
+H_SEQUENCE = 0   # Number of snapshots published so far
+H_FRONT = 1      # Slot holding the latest snapshot
+H_ITERATION = 2  # Iteration of the latest snapshot
+H_VISITED = 3    # Visited cells of the latest snapshot
+H_UNVISITED = 4  # Unvisited cells of the latest snapshot
+H_DONE = 5       # 1 once the simulation has ended and the final snapshot is published
+HEADER_FIELDS = 6
+
+# Coverage counts of a snapshot, as dsa_graphics.observer takes them
+SnapshotCoverage = collections.namedtuple('SnapshotCoverage', 'visited unvisited')
+Snapshot = collections.namedtuple('Snapshot', 'grid iter_count coverage done')
+
+
+class SnapshotBuffer:
+    """
+    Bounded double buffer of grid snapshots in shared memory, for one producer and
+    one consumer, which may be threads or processes. The producer writes into the
+    back slot without holding the lock and only swaps the slots under it; the
+    consumer copies the front slot under the lock. Snapshots the consumer doesn't
+    get to in time are overwritten, so neither side ever waits for the other's pace.
+    """
+
+    def __init__(self, shape, dtype, lock=None, name=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        header_size = HEADER_FIELDS * np.dtype(np.int64).itemsize
+        grid_size = int(np.prod(self.shape)) * self.dtype.itemsize
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=header_size + 2 * grid_size)
+            self.owner = True
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.lock = lock if lock is not None else multiprocessing.Lock()
+        self.header = np.ndarray(HEADER_FIELDS, dtype=np.int64, buffer=self.memory.buf)
+        self.slots = [np.ndarray(self.shape, dtype=self.dtype, buffer=self.memory.buf,
+                                 offset=header_size + slot * grid_size) for slot in range(2)]
+        if self.owner:
+            self.header[:] = 0
+        self.seen = 0
+
+    def spec(self):
+        """What another process needs to attach to this buffer: SnapshotBuffer(*spec)."""
+        return self.shape, self.dtype.str, self.lock, self.memory.name
+
+    def publish(self, grid, iter_count, visited, unvisited, done=False):
+        """Makes the grid the latest snapshot."""
+        back = 1 - int(self.header[H_FRONT])
+        self.slots[back][...] = grid
+        with self.lock:
+            self.header[H_FRONT] = back
+            self.header[H_ITERATION] = iter_count
+            self.header[H_VISITED] = visited
+            self.header[H_UNVISITED] = unvisited
+            self.header[H_DONE] = done
+            self.header[H_SEQUENCE] += 1
+
+    def latest(self, into=None):
+        """
+        Copy of the latest snapshot (into the given array, if any),
+        or None if there's none newer than the last one taken.
+        """
+        with self.lock:
+            sequence = int(self.header[H_SEQUENCE])
+            if sequence == self.seen:
+                return None
+            self.seen = sequence
+            front = int(self.header[H_FRONT])
+            if into is None:
+                into = self.slots[front].copy()
+            else:
+                into[...] = self.slots[front]
+            iter_count, visited, unvisited, done = self.header[[H_ITERATION, H_VISITED, H_UNVISITED, H_DONE]].tolist()
+        return Snapshot(into, iter_count, SnapshotCoverage(visited, unvisited), bool(done))
+
+    def close(self):
+        self.header = self.slots = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+def simulate(buffer_spec, results, config, threshold, engine, stopping, seed, publish_interval):
+    """
+    Worker of AsyncSimulation: runs the simulation and publishes snapshots along
+    the way, at most every publish_interval seconds, and always the final one.
+    Puts the total number of iterations and the stopping reason into results.
+    """
+    buffer = SnapshotBuffer(*buffer_spec)
+    try:
+        if seed is not None:
+            random.seed(seed)
+        grid = init_grid(config)
+        last_publish = [0.0]
+
+        def publish(grid, iter_count, coverage):
+            now = time.monotonic()
+            if now - last_publish[0] >= publish_interval:
+                buffer.publish(grid, iter_count, coverage.visited, coverage.unvisited)
+                last_publish[0] = now
+
+        def publish_final(grid, iter_count, coverage):
+            buffer.publish(grid, iter_count, coverage.visited, coverage.unvisited, done=True)
+
+        iter_count = continue_simulation(grid, 0, threshold, engine, stopping=stopping,
+                                         on_step=publish, on_end=publish_final)
+        results.put((iter_count, stopping.reason))
+    except BaseException:
+        results.put((None, None))
+        raise
+    finally:
+        buffer.close()
+
+
+class AsyncSimulation:
+    """
+    Simulation running in a worker thread (or process, with use_process=True)
+    that publishes its grid through a SnapshotBuffer, so that whoever watches it
+    (see dsa_graphics.display_simulation) takes the latest snapshot at its own pace
+    and never slows the simulation down. A worker process doesn't share the GIL
+    with the display; a thread shares the module-level random and the engines' state.
+    """
+
+    def __init__(self, threshold=75, engine=ENGINE_LOOP, config=None, stopping=None,
+                 use_process=False, seed=None, publish_interval=PUBLISH_INTERVAL):
+        self.config = config if config is not None else SimulationConfig()
+        self.cancel = multiprocessing.Event()
+        # The caller's rule is left as it was, its copy stops when the simulation is stopped
+        stopping = copy.copy(stopping) if stopping is not None else StoppingRule()
+        stopping.cancel = self.cancel
+        self.buffer = SnapshotBuffer(self.config.padded_shape, self.config.cell_type)
+        self.results = multiprocessing.Queue(1)
+        worker = multiprocessing.Process if use_process else threading.Thread
+        self.worker = worker(target=simulate, daemon=True,
+                             args=(self.buffer.spec(), self.results, self.config, threshold, engine,
+                                   stopping, seed, publish_interval))
+        self.iter_count = None
+        self.reason = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def grid_w(self):
+        return self.config.grid_w
+
+    @property
+    def grid_h(self):
+        return self.config.grid_h
+
+    @property
+    def running(self):
+        return self.worker.is_alive()
+
+    def start(self):
+        self.worker.start()
+
+    def latest(self, into=None):
+        """Latest snapshot not taken yet (see SnapshotBuffer.latest), or None."""
+        return self.buffer.latest(into)
+
+    def stop(self):
+        """Asks the worker to stop after its current step."""
+        self.cancel.set()
+
+    def join(self):
+        """
+        Waits for the worker; returns the total number of iterations,
+        with the reason of an early stop (or None) in reason.
+        """
+        if self.iter_count is None:
+            self.iter_count, self.reason = self.results.get()
+            self.worker.join()
+        return self.iter_count
+
+    def close(self):
+        if self.worker.is_alive():
+            self.stop()
+            self.join()
+        self.buffer.close()
+
+
+def run_simulation_with_display(threshold=75, engine=ENGINE_LOOP, config=None, stopping=None,
+                                use_process=False, seed=None, fps=FPS):
+    """
+    Runs the simulation in the background (see AsyncSimulation) while a pygame
+    window shows it at fps frames a second. Returns the number of iterations,
+    with the stopping reason in stopping.reason when a StoppingRule is given.
+    """
+    with AsyncSimulation(threshold, engine, config, stopping, use_process, seed) as simulation:
+        iter_count = display_simulation(simulation, fps)
+    if stopping is not None:
+        stopping.reason = simulation.reason
+    return iter_count
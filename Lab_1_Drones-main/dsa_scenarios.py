@@ -0,0 +1,128 @@
+import os
+import numpy as np
+from PIL import Image
+from dsa_automaton import collision_layers, PAD, CELL_TYPE, L_OBST, L_DRON, L_VIS, L_GRAD, L_COLL1, L_COLL2
+from dsa_automaton import DR_HERE, DR_NONE, V_UNVISITED, V_UNREACHABLE
+
+# Scenario parameters
+SCENARIO_SEED = 0
+DRONE_DENSITY = 0.002     # Share of cells holding a drone
+MAZE_PITCH = 8            # Maze rooms repeat every this many cells...
+MAZE_WALL = 2             # ...of which this many are wall
+CLUTTER_DENSITY = 0.2     # Share of cells occupied by single-cell obstacles in dense clutter
+CLUTTER_BLOCKS = 0.002    # Share of cells that are corners of 2x2..4x4 blocks in dense clutter
+FIELD_OBSTACLES = 0.02    # Share of cells occupied by obstacles around clustered spawns
+SPAWN_CLUSTERS = 4        # Number of spawn clusters
+SPAWN_SPREAD = 0.03       # Standard deviation of a spawn cluster, as a share of the map size
+
+
+def assemble_grid(obstacles, drones, cell_type=CELL_TYPE):
+    """
+    Builds a padded grid of the same layout as init_grid from boolean
+    (grid_w, grid_h) maps of obstacles and drones; drones on obstacles are dropped.
+    """
+    np_obstacles = obstacles.astype(cell_type)
+    np_drones = np.where(drones & ~obstacles, DR_HERE, DR_NONE).astype(cell_type)
+    np_visits = np.where(obstacles, V_UNREACHABLE, V_UNVISITED).astype(cell_type)
+
+    grid_wp, grid_hp = obstacles.shape[0] + 2*PAD, obstacles.shape[1] + 2*PAD
+    grid = np.empty((grid_wp, grid_hp, L_COLL2 + 1), dtype=cell_type)
+    grid[..., L_OBST] = np.pad(np_obstacles, pad_width=PAD, mode='constant', constant_values=1)
+    grid[..., L_DRON] = np.pad(np_drones, pad_width=PAD, mode='constant', constant_values=DR_NONE)
+    grid[..., L_VIS] = np.pad(np_visits, pad_width=PAD, mode='constant', constant_values=V_UNREACHABLE)
+    grid[..., L_GRAD] = 0
+    grid[..., L_COLL1], grid[..., L_COLL2] = collision_layers(grid_wp, grid_hp, cell_type)
+    return grid
+
+
+def scatter_drones(rng, shape, density=DRONE_DENSITY):
+    return rng.random(shape) < density
+
+
+def open_field(rng, size):
+    """No obstacles at all, drones scattered uniformly."""
+    obstacles = np.zeros((size, size), dtype=bool)
+    return obstacles, scatter_drones(rng, obstacles.shape)
+
+
+def maze(rng, size):
+    """
+    Binary-tree maze of square rooms, each opened towards the room
+    above or to the left of it; corridors are wider than a big zone.
+    """
+    xs = np.arange(size)[:, None]
+    ys = np.arange(size)[None, :]
+    room_x, room_y = xs // MAZE_PITCH, ys // MAZE_PITCH
+    wall_x, wall_y = xs % MAZE_PITCH < MAZE_WALL, ys % MAZE_PITCH < MAZE_WALL
+
+    # Direction of the opening of every room: True - up (smaller x), False - left
+    rooms = -(-size // MAZE_PITCH)
+    up = rng.random((rooms, rooms)) < 0.5
+    up[:, 0] = True
+    up[0, :] = False
+    opening_up = up[room_x, room_y] & (room_x > 0)
+    opening_left = ~up[room_x, room_y] & (room_y > 0)
+
+    free = ~wall_x & ~wall_y
+    free |= wall_x & ~wall_y & opening_up
+    free |= ~wall_x & wall_y & opening_left
+    obstacles = ~free
+    return obstacles, scatter_drones(rng, obstacles.shape)
+
+
+def dense_clutter(rng, size):
+    """Single-cell obstacles and small blocks everywhere, drones scattered among them."""
+    obstacles = rng.random((size, size)) < CLUTTER_DENSITY
+    corners_x, corners_y = np.nonzero(rng.random((size, size)) < CLUTTER_BLOCKS)
+    extents = rng.integers(2, 5, size=(2, corners_x.shape[0]))
+    for dx in range(4):
+        for dy in range(4):
+            inside = (dx < extents[0]) & (dy < extents[1])
+            obstacles[np.minimum(corners_x[inside] + dx, size - 1),
+                      np.minimum(corners_y[inside] + dy, size - 1)] = True
+    return obstacles, scatter_drones(rng, obstacles.shape)
+
+
+def clustered_spawns(rng, size):
+    """Few obstacles; all drones start in a few tight clusters."""
+    obstacles = rng.random((size, size)) < FIELD_OBSTACLES
+    drone_count = int(size * size * DRONE_DENSITY)
+    centers = rng.random((SPAWN_CLUSTERS, 2)) * size
+    cluster = rng.integers(0, SPAWN_CLUSTERS, size=drone_count)
+    positions = rng.normal(centers[cluster], SPAWN_SPREAD * size)
+    positions = np.clip(np.rint(positions), 0, size - 1).astype(int)
+    drones = np.zeros((size, size), dtype=bool)
+    drones[positions[:, 0], positions[:, 1]] = True
+    return obstacles, drones
+
+
+SCENARIOS = {
+    'open_field': open_field,
+    'maze': maze,
+    'dense_clutter': dense_clutter,
+    'clustered_spawns': clustered_spawns,
+}
+
+
+def scenario_maps(name, size, seed=SCENARIO_SEED):
+    """Boolean (size, size) maps of obstacles and drones of a scenario; the same for the same seed."""
+    return SCENARIOS[name](np.random.default_rng(seed), size)
+
+
+def make_scenario(name, size, seed=SCENARIO_SEED, cell_type=CELL_TYPE):
+    """Padded grid of a scenario."""
+    return assemble_grid(*scenario_maps(name, size, seed), cell_type)
+
+
+def save_scenario_bitmaps(name, size, directory='.', seed=SCENARIO_SEED):
+    """
+    Writes the scenario as a pair of bitmaps in the format init_grid reads
+    (black - obstacle or drone) and returns their paths, for a SimulationConfig.
+    """
+    obstacles, drones = scenario_maps(name, size, seed)
+    paths = []
+    for layer, kind in ((obstacles, 'obstacles'), (drones & ~obstacles, 'drones')):
+        path = os.path.join(directory, f'bitmap_{kind}_{name}_{size}.bmp')
+        Image.fromarray(np.where(layer, 0, 255).astype(np.uint8)).save(path)
+        paths.append(path)
+    return paths
@@ -0,0 +1,67 @@
+import numpy as np
+from dsa_automaton import CoverageCounter, PAD, L_DRON, L_VIS, DR_HERE, DR_NONE, DR_NEAR, DR_VECT
+from dsa_vectorized import gather_zones, decide_and_move, drone_marks, stale_drone_marks, write_zones
+
+
+# Unique interior cells among (cx, cy) whose drone value is one of values, in scan order
+def select_cells(grid, cx, cy, values):
+    grid_w, grid_h = grid.shape[0] - 2*PAD, grid.shape[1] - 2*PAD
+    inside = (cx >= PAD) & (cx < PAD+grid_w) & (cy >= PAD) & (cy < PAD+grid_h)
+    cx, cy = cx[inside], cy[inside]
+    selected = np.isin(grid[cx, cy, L_DRON], values)
+    cx, cy = cx[selected], cy[selected]
+    key = np.unique(cx.astype(np.int64) * grid.shape[1] + cy)
+    return key // grid.shape[1], key % grid.shape[1]
+
+
+class SparseSwarm:
+    """
+    Simulation mode that keeps explicit arrays of drone positions and of
+    DR_NEAR/DR_VECT cells instead of scanning the whole grid every step.
+    The grid is updated in place, with the same result as dsa_automaton.update_grid.
+    Step cost grows with the number of drones, not with the area of the grid.
+    """
+
+    def __init__(self, grid, frontier=None):
+        grid_w, grid_h = grid.shape[0] - 2*PAD, grid.shape[1] - 2*PAD
+        interior = grid[PAD:PAD+grid_w, PAD:PAD+grid_h, L_DRON]
+        known = np.isin(interior, (DR_NONE, DR_NEAR, DR_VECT, DR_HERE))
+        if not known.all():
+            x, y = np.argwhere(~known)[0]
+            raise ValueError(f'Problem with cell drone value: {int(interior[x, y])} at {x}, {y}')
+        self.grid = grid.copy()
+        # Padded coordinates, in the scan order of the loop engine
+        xs, ys = np.nonzero(interior == DR_HERE)
+        self.drone_x, self.drone_y = xs + PAD, ys + PAD
+        self.mark_x, self.mark_y = drone_marks(grid)
+        self.coverage = CoverageCounter(grid)
+        # Optional guide of the drones which gain nothing nearby, as in update_grid
+        self.frontier = frontier
+
+    @property
+    def drone_count(self):
+        return self.drone_x.shape[0]
+
+    def step(self, iter_count=0):
+        """Advances the swarm by one step and returns the updated grid."""
+        grid = self.grid
+        zones = gather_zones(grid, self.drone_x, self.drone_y)
+        directions = None if self.frontier is None else self.frontier.directions(grid, self.drone_x, self.drone_y)
+        np_drones, np_visit, writes = decide_and_move(
+            zones, iter_count, (self.drone_x - PAD, self.drone_y - PAD), directions=directions,
+            keeps_heading=self.frontier is None or self.frontier.keeps_heading)
+        sx, sy = stale_drone_marks(grid, self.mark_x, self.mark_y)
+
+        # All reads are done, so the grid can be written in place
+        zone_x, zone_y = write_zones(grid, self.drone_x[writes], self.drone_y[writes],
+                                     np_drones[writes], np_visit[writes], sx, sy, self.coverage)
+        if self.frontier is not None:
+            self.frontier.record(grid, zone_x, zone_y, zones[writes][..., L_VIS].ravel())
+
+        # Drones and their marks can only appear where something was written,
+        # or stay where they were
+        cx = np.concatenate((self.drone_x, self.mark_x, zone_x))
+        cy = np.concatenate((self.drone_y, self.mark_y, zone_y))
+        self.drone_x, self.drone_y = select_cells(grid, cx, cy, (DR_HERE,))
+        self.mark_x, self.mark_y = select_cells(grid, cx, cy, (DR_NEAR, DR_VECT))
+        return grid
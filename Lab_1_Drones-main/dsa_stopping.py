@@ -0,0 +1,124 @@
+import collections
+import math
+import statistics
+import time
+import numpy as np
+from dsa_automaton import L_DRON, DR_HERE
+
+# Stopping parameters
+STALL_WINDOW = 1000     # Steps over which coverage has to grow...
+STALL_MIN_GAIN = 0.0    # ...by more than this many percentage points
+MIN_SIMULATIONS = 5     # Trials run before the confidence interval is looked at
+CONFIDENCE = 0.95       # Confidence level of the interval of mean iterations
+SMALL_DF = 4            # Up to this many degrees of freedom, t quantiles are computed exactly
+
+# Reasons to stop a run before its threshold is reached
+STOP_ITERATIONS = 'iterations'  # Iteration budget used up
+STOP_TIME = 'time'              # Wall-clock budget used up
+STOP_STALL = 'stall'            # Coverage didn't grow over the stall window
+STOP_NO_DRONES = 'no drones'    # All drones are gone
+STOP_CANCELLED = 'cancelled'    # Stopped from outside, e.g. the display window was closed
+
+
+class StoppingRule:
+    """
+    Decides when a threshold run should give up: after max_iterations steps,
+    after max_seconds of wall time, when coverage grew by no more than stall_min_gain
+    percentage points over the last stall_window steps, or when no drone is left.
+    None disables a budget or the stall detection. With a cancel event (threading
+    or multiprocessing), runs also stop as soon as it's set. The reason of the last
+    stop, or None if the run reached its threshold, is kept in reason.
+    """
+
+    def __init__(self, max_iterations=None, max_seconds=None,
+                 stall_window=STALL_WINDOW, stall_min_gain=STALL_MIN_GAIN, cancel=None):
+        self.max_iterations = max_iterations
+        self.max_seconds = max_seconds
+        self.stall_window = stall_window
+        self.stall_min_gain = stall_min_gain
+        self.cancel = cancel
+        self.reason = None
+        self.start_iter = 0
+        self.start_time = 0.0
+        self.history = None
+
+    def start(self, iter_count):
+        """Starts a new run (or continues a resumed one) at the given iteration."""
+        self.reason = None
+        self.start_iter = iter_count
+        self.start_time = time.monotonic()
+        window = self.stall_window + 1 if self.stall_window is not None else 1
+        self.history = collections.deque(maxlen=window)
+
+    def should_stop(self, grid, iter_count, progress):
+        """Checked before every step; records the reason and returns True if the run has to stop."""
+        self.reason = self.check(grid, iter_count, progress)
+        return self.reason is not None
+
+    def check(self, grid, iter_count, progress):
+        if self.cancel is not None and self.cancel.is_set():
+            return STOP_CANCELLED
+        if self.max_iterations is not None and iter_count - self.start_iter >= self.max_iterations:
+            return STOP_ITERATIONS
+        if self.max_seconds is not None and time.monotonic() - self.start_time >= self.max_seconds:
+            return STOP_TIME
+        # Without drones coverage stands still, so they're only
+        # counted when it didn't change since the last step
+        if self.history and self.history[-1] == progress and not (grid[..., L_DRON] == DR_HERE).any():
+            return STOP_NO_DRONES
+        self.history.append(progress)
+        if (self.stall_window is not None and len(self.history) == self.history.maxlen and
+                progress - self.history[0] <= self.stall_min_gain):
+            return STOP_STALL
+        return None
+
+
+def t_cdf_small(t, df):
+    """Distribution function of Student's t for 1 to SMALL_DF degrees of freedom, in closed form."""
+    if df == 1:
+        return 0.5 + math.atan(t) / math.pi
+    if df == 2:
+        return 0.5 + t / (2 * math.sqrt(2 + t*t))
+    if df == 3:
+        u = t / math.sqrt(3)
+        return 0.5 + (u / (1 + u*u) + math.atan(u)) / math.pi
+    v = t*t / (4 + t*t)
+    return 0.5 + 0.375 * t / math.sqrt(1 + t*t/4) * (1 - v / 3)
+
+
+def t_quantile(p, df):
+    """
+    Quantile of Student's t distribution: the Cornish-Fisher expansion of the normal one,
+    which is only accurate from SMALL_DF + 1 degrees of freedom on (9.71 instead of 12.71
+    for 1 degree at 95%); below, the closed-form distribution function is inverted by bisection.
+    """
+    if df <= SMALL_DF:
+        if p < 0.5:
+            return -t_quantile(1 - p, df)
+        low, high = 0.0, 1.0
+        while t_cdf_small(high, df) < p:
+            low, high = high, high * 2
+        for _ in range(100):
+            middle = (low + high) / 2
+            low, high = (middle, high) if t_cdf_small(middle, df) < p else (low, middle)
+        return (low + high) / 2
+    z = statistics.NormalDist().inv_cdf(p)
+    return (z + (z**3 + z) / (4 * df) + (5 * z**5 + 16 * z**3 + 3 * z) / (96 * df**2)
+            + (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / (384 * df**3))
+
+
+def mean_confidence_interval(values, confidence=CONFIDENCE):
+    """Mean of the values and the half-width of its confidence interval (inf for fewer than 2)."""
+    mean = float(np.mean(values))
+    if len(values) < 2:
+        return mean, math.inf
+    error = float(np.std(values, ddof=1)) / math.sqrt(len(values))
+    return mean, t_quantile(0.5 + confidence / 2, len(values) - 1) * error
+
+
+def precise_enough(values, precision, confidence=CONFIDENCE, min_count=MIN_SIMULATIONS):
+    """True once the confidence interval of the mean is within +-precision of the mean (relative)."""
+    if len(values) < max(min_count, 2):
+        return False
+    mean, half_width = mean_confidence_interval(values, confidence)
+    return half_width <= precision * abs(mean)
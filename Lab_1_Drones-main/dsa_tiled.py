@@ -0,0 +1,157 @@
+import os
+import random
+from multiprocessing import Pool, shared_memory
+import numpy as np
+from dsa_automaton import CoverageCounter, BIG_ZONE_R, PAD, L_DRON
+from dsa_automaton import DR_HERE, DR_NONE, DR_NEAR, DR_VECT
+from dsa_vectorized import gather_zones, decide_moves, apply_moves, stale_drone_marks, write_zones
+
+# Tiling parameters
+BANDS_PER_PROCESS = 2  # Tiles per worker process, for load balancing
+
+# The two shared grid buffers of a worker process: the current grid and the next one
+worker_grids = None
+worker_memory = None
+
+
+def attach_grids(names, shape, dtype):
+    """Pool initializer: maps both grid buffers from shared memory."""
+    global worker_grids, worker_memory
+    worker_memory = [shared_memory.SharedMemory(name=name) for name in names]
+    worker_grids = [np.ndarray(shape, dtype=dtype, buffer=memory.buf) for memory in worker_memory]
+
+
+# Padded coordinates of the drones and of the DR_NEAR/DR_VECT cells
+# in the interior rows x0 <= x < x1, in scan order
+def band_cells(grid, x0, x1, values):
+    grid_h = grid.shape[1] - 2*PAD
+    band = grid[PAD+x0:PAD+x1, PAD:PAD+grid_h, L_DRON]
+    xs, ys = np.nonzero(np.isin(band, values))
+    return xs + PAD + x0, ys + PAD
+
+
+def decide_band(args):
+    """
+    First phase of a step, for one tile: decisions of the drones in its rows.
+    Returns what the main process needs to draw the random picks in global scan order.
+    """
+    source, x0, x1, iter_count = args
+    grid = worker_grids[source]
+    grid_h = grid.shape[1] - 2*PAD
+    band = grid[PAD+x0:PAD+x1, PAD:PAD+grid_h, L_DRON]
+    known = np.isin(band, (DR_NONE, DR_NEAR, DR_VECT, DR_HERE))
+    if not known.all():
+        x, y = np.argwhere(~known)[0]
+        return {'problem': (x0 + x, y, int(band[x, y]))}
+
+    px, py = band_cells(grid, x0, x1, (DR_HERE,))
+    decisions = decide_moves(gather_zones(grid, px, py), iter_count)
+    inside = np.flatnonzero(decisions['writes'] & decisions['inside'])
+    return {
+        'problem': None,
+        'rows': px - PAD,
+        'choosers': decisions['choosers'],
+        'choice_counts': decisions['choice_counts'],
+        'inside': list(zip((px[inside] - PAD).tolist(), (py[inside] - PAD).tolist())),
+    }
+
+
+def move_band(args):
+    """
+    Second phase of a step, for one tile: moves all drones whose big zones reach
+    into the tile (its halo is BIG_ZONE_R rows wide) and writes the tile's rows
+    of the next grid. Conflicting writes are resolved by global scan order, as in
+    the loop engine, so the result doesn't depend on the tiling.
+    Returns the changes of the coverage counts within the tile.
+    """
+    source, x0, x1, iter_count, picks = args
+    grid = worker_grids[source]
+    new_grid = worker_grids[1 - source]
+    grid_w = grid.shape[0] - 2*PAD
+    # Padded rows owned by this tile; the outer tiles also own the padding
+    owned_rows = (PAD + x0 if x0 > 0 else 0, PAD + x1 if x1 < grid_w else grid.shape[0])
+    new_grid[owned_rows[0]:owned_rows[1]] = grid[owned_rows[0]:owned_rows[1]]
+
+    px, py = band_cells(grid, max(0, x0 - BIG_ZONE_R), min(grid_w, x1 + BIG_ZONE_R), (DR_HERE,))
+    decisions = decide_moves(gather_zones(grid, px, py), iter_count)
+    np_drones, np_visit, writes = apply_moves(decisions, picks)
+    sx, sy = stale_drone_marks(grid, *band_cells(grid, x0, x1, (DR_NEAR, DR_VECT)))
+
+    # Counter starting from zero, to collect only this tile's changes
+    coverage = CoverageCounter(grid[:0])
+    write_zones(new_grid, px[writes], py[writes], np_drones[writes], np_visit[writes],
+                sx, sy, coverage, owned_rows)
+    return coverage.counts
+
+
+class TiledSwarm:
+    """
+    Parallel stepping of one large grid: the grid is split into tiles of whole
+    rows that are stepped concurrently by a pool of worker processes, on two grid
+    buffers in shared memory. Random picks are drawn by the main process in the
+    scan order of the loop engine, so the result is the same as update_grid's.
+    """
+
+    def __init__(self, grid, processes=None, tiles=None):
+        self.processes = processes or os.cpu_count()
+        grid_w = grid.shape[0] - 2*PAD
+        tiles = min(tiles or self.processes * BANDS_PER_PROCESS, grid_w)
+        self.edges = np.linspace(0, grid_w, tiles + 1).astype(int).tolist()
+        self.memory = [shared_memory.SharedMemory(create=True, size=grid.nbytes) for _ in range(2)]
+        self.grids = [np.ndarray(grid.shape, dtype=grid.dtype, buffer=memory.buf) for memory in self.memory]
+        self.grids[0][...] = grid
+        self.source = 0
+        self.pool = Pool(self.processes, initializer=attach_grids,
+                         initargs=([memory.name for memory in self.memory], grid.shape, grid.dtype))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def grid(self):
+        """Current grid; it's a shared buffer, valid until the step after next."""
+        return self.grids[self.source]
+
+    def step(self, iter_count=0, coverage=None):
+        """Advances the grid by one step and returns it, or None on an unexpected drone value."""
+        tiles = list(zip(self.edges[:-1], self.edges[1:]))
+        results = self.pool.map(decide_band, [(self.source, x0, x1, iter_count) for x0, x1 in tiles])
+        for result in results:
+            if result['problem'] is not None:
+                x, y, value = result['problem']
+                print(f'Problem with cell drone value: {value} at {x}, {y}')
+                return None
+        for result in results:
+            for x, y in result['inside']:
+                print(f'{iter_count}. Drone at {x},{y} is inside an obstacle - removing it')
+
+        # Tiles are in row order, so their drones are in global scan order
+        rows = np.concatenate([result['rows'] for result in results])
+        offsets = np.cumsum([0] + [len(result['rows']) for result in results])
+        choosers = np.concatenate([result['choosers'] + offset for result, offset in zip(results, offsets)])
+        counts = np.concatenate([result['choice_counts'] for result in results]).tolist()
+        picks = np.array([random.choice(range(n)) for n in counts], dtype=int)
+
+        grid_w = self.grids[0].shape[0] - 2*PAD
+        tasks = []
+        for x0, x1 in tiles:
+            first = np.searchsorted(rows, max(0, x0 - BIG_ZONE_R))
+            last = np.searchsorted(rows, min(grid_w, x1 + BIG_ZONE_R))
+            tile_picks = picks[np.searchsorted(choosers, first):np.searchsorted(choosers, last)]
+            tasks.append((self.source, x0, x1, iter_count, tile_picks))
+        deltas = self.pool.map(move_band, tasks)
+        if coverage is not None:
+            coverage.counts += np.sum(deltas, axis=0)
+
+        self.source = 1 - self.source
+        return self.grid
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        for memory in self.memory:
+            memory.close()
+            memory.unlink()
@@ -0,0 +1,155 @@
+import mmap
+import struct
+import zlib
+import numpy as np
+from dsa_automaton import L_DRON, L_VIS, L_GRAD, DR_HERE
+
+# Trajectory file parameters
+KEYFRAME_EVERY = 256     # Steps per chunk; every chunk starts with a full keyframe
+COMPRESSION_LEVEL = 6    # zlib compression level of the chunks
+
+# File layout:
+#   header: MAGIC, grid shape (3 x uint32), keyframe interval (uint32), dtype (8 bytes),
+#           length (uint64) and zlib-compressed bytes of the initial grid
+#   chunks: zlib-compressed blocks of KEYFRAME_EVERY steps each: the dynamic layers
+#           of the first step, then for every following step the changed cells
+#           of each of them as (count: uint32, flat indices: int32[count], values[count])
+#   index:  per chunk its offset, length and first iteration (3 x uint64)
+#   footer: index offset, chunk count, iteration count (3 x uint64), MAGIC
+MAGIC = b'DSATRJ02'
+HEADER = struct.Struct('<8s4I8sQ')
+INDEX_ENTRY = struct.Struct('<3Q')
+FOOTER = struct.Struct('<3Q8s')
+COUNT = struct.Struct('<I')
+
+# Layers that change from step to step; all others are stored once. Guided runs
+# (see dsa_gradient.GradientField) change L_GRAD too; it costs unguided runs an empty
+# delta per step. Files of the first version only have the drone and visit layers
+DYNAMIC_LAYERS = (L_DRON, L_VIS, L_GRAD)
+FILE_LAYERS = {MAGIC: DYNAMIC_LAYERS, b'DSATRJ01': (L_DRON, L_VIS)}
+
+
+class TrajectoryWriter:
+    """
+    Writes a simulation run to a compact trajectory file: the initial grid once,
+    then per-step deltas of the drone, visit and gradient layers in compressed chunks.
+    The first grid is the one given here (iteration 0), every append adds the next one.
+    """
+
+    def __init__(self, path, grid, keyframe_every=KEYFRAME_EVERY):
+        self.file = open(path, 'wb')
+        self.shape = grid.shape
+        self.dtype = grid.dtype
+        self.keyframe_every = keyframe_every
+        self.index = []
+        self.chunk = []
+        self.previous = None
+        self.iterations = 0
+
+        base = zlib.compress(np.ascontiguousarray(grid).tobytes(), COMPRESSION_LEVEL)
+        self.file.write(HEADER.pack(MAGIC, *grid.shape, keyframe_every,
+                                    grid.dtype.str.encode().ljust(8), len(base)))
+        self.file.write(base)
+        self.append(grid)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append(self, grid):
+        """Records the grid of the next iteration."""
+        layers = [np.ascontiguousarray(grid[..., layer]).ravel() for layer in DYNAMIC_LAYERS]
+        if self.iterations % self.keyframe_every == 0:
+            self.flush_chunk()
+            self.chunk = [layer.tobytes() for layer in layers]
+        else:
+            for layer, previous in zip(layers, self.previous):
+                changed = np.flatnonzero(layer != previous).astype(np.int32)
+                self.chunk += [COUNT.pack(changed.shape[0]), changed.tobytes(), layer[changed].tobytes()]
+        self.previous = layers
+        self.iterations += 1
+
+    def flush_chunk(self):
+        if not self.chunk:
+            return
+        data = zlib.compress(b''.join(self.chunk), COMPRESSION_LEVEL)
+        first_iteration = (self.iterations - 1) // self.keyframe_every * self.keyframe_every
+        self.index.append((self.file.tell(), len(data), first_iteration))
+        self.file.write(data)
+        self.chunk = []
+
+    def close(self):
+        """Writes the last chunk and the index; the file is readable only after this."""
+        if self.file.closed:
+            return
+        self.flush_chunk()
+        index_offset = self.file.tell()
+        for entry in self.index:
+            self.file.write(INDEX_ENTRY.pack(*entry))
+        self.file.write(FOOTER.pack(index_offset, len(self.index), self.iterations, MAGIC))
+        self.file.close()
+
+
+class TrajectoryReader:
+    """
+    Memory-mapped random access to a trajectory file: grid_at(i) rebuilds the grid
+    of iteration i from the keyframe of its chunk and the deltas that follow it.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data = memoryview(self.mmap)
+        magic, *shape, keyframe_every, dtype, base_length = HEADER.unpack_from(self.data, 0)
+        index_offset, chunk_count, self.iterations, end_magic = FOOTER.unpack_from(
+            self.data, len(self.data) - FOOTER.size)
+        if magic not in FILE_LAYERS or end_magic != magic:
+            raise ValueError(f'{path} is not a complete trajectory file')
+        self.layers = FILE_LAYERS[magic]
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype.rstrip(b' ').decode())
+        self.keyframe_every = keyframe_every
+        self.base = np.frombuffer(zlib.decompress(self.data[HEADER.size:HEADER.size+base_length]),
+                                  dtype=self.dtype).reshape(self.shape)
+        self.index = [INDEX_ENTRY.unpack_from(self.data, index_offset + i * INDEX_ENTRY.size)
+                      for i in range(chunk_count)]
+
+    def __len__(self):
+        return self.iterations
+
+    def close(self):
+        self.data.release()
+        self.mmap.close()
+
+    def grid_at(self, iteration):
+        """Full grid of the given iteration (0 is the initial grid)."""
+        if not 0 <= iteration < self.iterations:
+            raise IndexError(f'Iteration {iteration} is out of range 0..{self.iterations - 1}')
+        offset, length, first_iteration = self.index[iteration // self.keyframe_every]
+        chunk = memoryview(zlib.decompress(self.data[offset:offset+length]))
+
+        cells = self.shape[0] * self.shape[1]
+        size = cells * self.dtype.itemsize
+        layers = [np.frombuffer(chunk[i*size:(i+1)*size], dtype=self.dtype).copy()
+                  for i in range(len(self.layers))]
+        position = len(self.layers) * size
+        for _ in range(iteration - first_iteration):
+            for layer in layers:
+                count, = COUNT.unpack_from(chunk, position)
+                position += COUNT.size
+                changed = np.frombuffer(chunk[position:position + 4*count], dtype=np.int32)
+                position += 4 * count
+                values = np.frombuffer(chunk[position:position + count*self.dtype.itemsize], dtype=self.dtype)
+                position += count * self.dtype.itemsize
+                layer[changed] = values
+
+        grid = self.base.copy()
+        for layer_index, layer in zip(self.layers, layers):
+            grid[..., layer_index] = layer.reshape(self.shape[:2])
+        return grid
+
+    def drone_positions(self, iteration):
+        """Padded (x, y) coordinates of all drones at the given iteration."""
+        return np.nonzero(self.grid_at(iteration)[..., L_DRON] == DR_HERE)
@@ -0,0 +1,387 @@
+import random
+import numpy as np
+from dsa_automaton import BIG_ZONE_R, DRONE_VIS_R, PAD
+from dsa_automaton import L_OBST, L_DRON, L_VIS, L_COLL1, L_COLL2
+from dsa_automaton import DR_HERE, DR_NONE, DR_NEAR, DR_VECT
+from dsa_automaton import V_VISITED, V_UNVISITED, V_UNREACHABLE
+
+# All moves within the nearest 3x3 surrounding, in the same order as the
+# loop engine enumerates them (dx outer, dy inner). Standing still is
+# included, because the loop engine uses [(0, 0)] as a valid move list
+MOVES = [(dx, dy) for dx in range(-1, 1+1) for dy in range(-1, 1+1)]
+MOVE_INDEX = {move: i for i, move in enumerate(MOVES)}
+MOVE_STAY = MOVE_INDEX[(0, 0)]
+MOVES_DX = np.array([move[0] for move in MOVES])
+MOVES_DY = np.array([move[1] for move in MOVES])
+
+# Center of the "big zone" around every drone
+ZONE_C = BIG_ZONE_R
+
+
+# Gathers the "big zone" of every drone: (drones, 5, 5, layers)
+def gather_zones(grid, px, py):
+    offsets = np.arange(-BIG_ZONE_R, BIG_ZONE_R+1)
+    zone_x = px[:, None, None] + offsets[None, :, None]
+    zone_y = py[:, None, None] + offsets[None, None, :]
+    return grid[zone_x, zone_y]
+
+
+# Padded coordinates of all DR_NEAR/DR_VECT cells, in scan order
+def drone_marks(grid):
+    grid_w, grid_h = grid.shape[0] - 2*PAD, grid.shape[1] - 2*PAD
+    interior = grid[PAD:PAD+grid_w, PAD:PAD+grid_h, L_DRON]
+    mx, my = np.nonzero((interior == DR_NEAR) | (interior == DR_VECT))
+    return mx + PAD, my + PAD
+
+
+# Those of the DR_NEAR/DR_VECT cells (mx, my) that have no drone nearby
+def stale_drone_marks(grid, mx, my):
+    drone_near = np.zeros(mx.shape, dtype=bool)
+    for dx in range(-1, 1+1):
+        for dy in range(-1, 1+1):
+            drone_near |= ((grid[mx+dx, my+dy, L_DRON] == DR_HERE) &
+                           (grid[mx+dx, my+dy, L_VIS] != V_UNREACHABLE))
+    return mx[~drone_near], my[~drone_near]
+
+
+# Writes values into a layer so that, for every cell, the write with the
+# highest priority wins. This reproduces the overwriting order of the loop engine.
+# Returns x coordinates, old and new values of the written cells
+def apply_last_writes(layer, cx, cy, priority, values):
+    key = cx.astype(np.int64) * layer.shape[1] + cy
+    order = np.lexsort((priority, key))
+    key = key[order]
+    last = np.ones(key.shape, dtype=bool)
+    last[:-1] = key[1:] != key[:-1]
+    cx, cy, values = cx[order][last], cy[order][last], values[order][last]
+    old_values = layer[cx, cy]
+    layer[cx, cy] = values
+    return cx, old_values, values
+
+
+# Every drone (px, py) writes back its whole big zone, and every stale
+# DR_NEAR/DR_VECT cell (sx, sy) is cleared, in the scan order of the loop
+# engine: later writes win. With owned_rows=(x0, x1), only the rows x0 <= x < x1
+# are written. Returns the coordinates of the written zone cells
+def write_zones(new_grid, px, py, np_drones, np_visit, sx, sy, coverage=None, owned_rows=None):
+    grid_h = new_grid.shape[1] - 2*PAD
+    offsets = np.arange(-BIG_ZONE_R, BIG_ZONE_R+1)
+    ox, oy = np.meshgrid(offsets, offsets, indexing='ij')
+    zone_x = (px[:, None, None] + ox).ravel()
+    zone_y = (py[:, None, None] + oy).ravel()
+    priority = np.repeat((px - PAD) * grid_h + (py - PAD), ox.size)
+    np_drones = np_drones.ravel()
+    np_visit = np_visit.ravel()
+    if owned_rows is not None:
+        owned = (zone_x >= owned_rows[0]) & (zone_x < owned_rows[1])
+        zone_x, zone_y, priority = zone_x[owned], zone_y[owned], priority[owned]
+        np_drones, np_visit = np_drones[owned], np_visit[owned]
+
+    visit_changes = apply_last_writes(new_grid[..., L_VIS], zone_x, zone_y, priority, np_visit)
+    if coverage is not None:
+        cells_x, old_values, new_values = visit_changes
+        coverage.record(old_values, new_values, cells_x)
+    apply_last_writes(new_grid[..., L_DRON],
+                      np.concatenate((zone_x, sx)),
+                      np.concatenate((zone_y, sy)),
+                      np.concatenate((priority, (sx - PAD) * grid_h + (sy - PAD))),
+                      np.concatenate((np_drones,
+                                      np.full(sx.shape, DR_NONE, dtype=new_grid.dtype))))
+    return zone_x, zone_y
+
+
+# Moves among the candidates that best follow the directions (gx, gy) of the drones,
+# and which drones have any move going that way: as dsa_automaton.guided_moves
+def guided_moves(candidates, gx, gy):
+    scores = np.where(candidates, MOVES_DX * gx[:, None] + MOVES_DY * gy[:, None], 0)
+    best_score = scores.max(axis=1)
+    guided = best_score > 0
+    return candidates & (scores == best_score[:, None]) & guided[:, None], guided
+
+
+# Decisions of all drones at once, up to the random picks: steps I.1 to II
+# of the loop engine. Returns the state that apply_moves needs, as a dictionary
+def decide_moves(zones, iter_count=0, coords=None, directions=None, keeps_heading=True):
+    count = zones.shape[0]
+    rows = np.arange(count)
+    c = ZONE_C
+    np_obst = zones[..., L_OBST]
+    np_drones = zones[..., L_DRON].copy()
+    np_visit = zones[..., L_VIS].copy()
+    coll1 = zones[:, c, c, L_COLL1]
+    coll2 = zones[:, c, c, L_COLL2]
+
+    # What was the previous cell? The first DR_NONE around the drone
+    has_prev = np.zeros(count, dtype=bool)
+    prev_x = np.ones(count, dtype=int)
+    prev_y = np.ones(count, dtype=int)
+    for dx in range(-1, 1+1):
+        for dy in range(-1, 1+1):
+            found = ~has_prev & (np_drones[:, c+dx, c+dy] == DR_NONE)
+            prev_x[found] = dx
+            prev_y[found] = dy
+            has_prev |= found
+
+    # Drone visits cells within its visit radius, including its own cell
+    np_visit[:, c-DRONE_VIS_R:c+DRONE_VIS_R+1, c-DRONE_VIS_R:c+DRONE_VIS_R+1] = V_VISITED
+
+    # Values of the move targets, (drones, moves)
+    target_obst = np_obst[:, c+MOVES_DX, c+MOVES_DY] != 0
+    target_drone = np_drones[:, c+MOVES_DX, c+MOVES_DY]
+
+    #    I. Decision making
+    # 1. Exclude obstacles and cells occupied by other drones
+    possible = np.ones((count, len(MOVES)), dtype=bool)
+    possible[:, MOVE_STAY] = False
+    possible &= ~target_obst & (target_drone != DR_HERE)
+    # Drones without any move don't change the grid at all
+    writes = possible.any(axis=1)
+
+    # 2. Exclude moves that could get the drone too close to another drone
+    remove = np.zeros(count, dtype=bool)
+    thrust = np.zeros(count, dtype=bool)
+    for dx in range(-BIG_ZONE_R, BIG_ZONE_R+1):
+        for dy in range(-BIG_ZONE_R, BIG_ZONE_R+1):
+            collision_val = np_drones[:, c+dx, c+dy]
+            scanning = ~(remove | thrust)
+            if -1 <= dx <= 1 and -1 <= dy <= 1:
+                if dx == dy == 0:
+                    continue
+                # Collision imminent, thrust away
+                hit = scanning & (collision_val == DR_HERE)
+                possible[hit] = False
+                possible[hit, MOVE_INDEX[(-dx, -dy)]] = True
+                thrust |= hit
+                # Remove one of the "neighboring" drones
+                if abs(dx) != abs(dy):
+                    removal_flag = coll1 != 0
+                else:
+                    removal_flag = coll2 != 0
+                removed = hit & removal_flag
+                possible[removed] = False
+                possible[removed, MOVE_STAY] = True
+                remove |= removed
+                continue
+            near = scanning & (collision_val == DR_NEAR)
+            if dx == BIG_ZONE_R:
+                possible[near[:, None] & (MOVES_DX == 1)] = False
+            if dx == -BIG_ZONE_R:
+                possible[near[:, None] & (MOVES_DX == -1)] = False
+            if dy == BIG_ZONE_R:
+                possible[near[:, None] & (MOVES_DY == 1)] = False
+            if dy == -BIG_ZONE_R:
+                possible[near[:, None] & (MOVES_DY == -1)] = False
+            vect = (scanning & ~near &
+                    ((collision_val == DR_VECT) | (collision_val == DR_HERE)) &
+                    (dx != -prev_x) & (dy != -prev_y))
+            half_dx = dx // 2 if abs(dx) > 1 else dx
+            half_dy = dy // 2 if abs(dy) > 1 else dy
+            possible[vect] = False
+            possible[vect, MOVE_INDEX[(-half_dx, -half_dy)]] = True
+            thrust |= vect
+
+    possible[~possible.any(axis=1), MOVE_STAY] = True
+
+    # If drone is already stuck inside an obstacle - remove it
+    inside = writes & (np_obst[:, c, c] != 0)
+    if coords is not None:
+        for i in np.flatnonzero(inside):
+            print(f'{iter_count}. Drone at {coords[0][i]},{coords[1][i]} is inside an obstacle - removing it')
+    remove |= inside
+
+    # If drone is thrusting into an obstacle - just stop
+    single = possible.sum(axis=1) == 1
+    blocked = single & target_obst[rows, possible.argmax(axis=1)]
+    possible[blocked] = False
+    possible[blocked, MOVE_STAY] = True
+
+    # 3. Unvisited cells take more priority
+    np_unvisited = (np_visit == V_UNVISITED)
+    unvisited_count = np.zeros((count, len(MOVES)), dtype=int)
+    for i, (dx, dy) in enumerate(MOVES):
+        unvisited_count[:, i] = np_unvisited[:, c+dx-1:c+dx+2, c+dy-1:c+dy+2].sum(axis=(1, 2))
+    prioritized = possible & ~single[:, None] & (unvisited_count != 0)
+    has_priority = prioritized.any(axis=1)
+    max_count = np.where(prioritized, unvisited_count, -1).max(axis=1)
+    best = prioritized & (unvisited_count == max_count[:, None])
+
+    #    II. Drone movement
+    # Continue in the same direction if nothing is gained, when possible
+    keep_heading = MOVE_INDEX[(0, 0)] + (-prev_x) * 3 + (-prev_y)
+    heading_ok = ~has_priority & has_prev & possible[rows, keep_heading]
+    candidates = np.where(has_priority[:, None], best, possible)
+    # With directions to unvisited cells, drones follow them instead of
+    # a random move, and instead of their heading unless they keep it
+    if directions is not None:
+        aligned, guided = guided_moves(possible, *directions)
+        guided &= ~has_priority
+        if keeps_heading:
+            guided &= ~heading_ok
+        heading_ok &= ~guided
+        candidates[guided] = aligned[guided]
+    # Drones that pick their move at random, among this many candidates
+    choosers = np.flatnonzero(writes & ~heading_ok)
+
+    # Final cleanup of possible moves
+    free = (possible & ~target_obst &
+            (target_drone != DR_HERE) & (target_drone != DR_VECT))
+    free[:, MOVE_STAY] = False
+    stuck = ~free.any(axis=1)
+
+    return {
+        'np_drones': np_drones,
+        'np_visit': np_visit,
+        'writes': writes,
+        'remove': remove,
+        'stuck': stuck,
+        'thrust': thrust,
+        'move': keep_heading,
+        'candidates': candidates,
+        'choosers': choosers,
+        'choice_counts': candidates[choosers].sum(axis=1),
+        'inside': inside,
+    }
+
+
+# Random picks of the choosing drones, drawn in the scan order of the loop engine
+# from rngs[i] for drone i, or from the module-level random
+def draw_picks(decisions, rngs=None):
+    counts = decisions['choice_counts'].tolist()
+    if rngs is None:
+        picks = [random.choice(range(n)) for n in counts]
+    else:
+        picks = [rngs[i].choice(range(n)) for i, n in zip(decisions['choosers'].tolist(), counts)]
+    return np.array(picks, dtype=int)
+
+
+# Drone movement (steps II.1 to II.5 of the loop engine) with the given picks.
+# Returns the modified drone and visit layers of every "big zone",
+# and which drones write their zone back
+def apply_moves(decisions, picks):
+    c = ZONE_C
+    np_drones = decisions['np_drones'].copy()
+    np_visit = decisions['np_visit']
+    writes = decisions['writes']
+    remove = decisions['remove']
+    stuck = decisions['stuck']
+    choosers = decisions['choosers']
+    move = decisions['move'].copy()
+    if len(choosers):
+        ranks = np.cumsum(decisions['candidates'][choosers], axis=1)
+        move[choosers] = np.argmax(ranks == (picks + 1)[:, None], axis=1)
+    mov_dx = MOVES_DX[move]
+    mov_dy = MOVES_DY[move]
+
+    keep = writes & ~remove
+    gone = writes & remove
+    near_x, near_y = np.nonzero(np.ones((3, 3), dtype=bool))
+    near_x, near_y = near_x - 1, near_y - 1
+    ring = (near_x != 0) | (near_y != 0)
+    near_x, near_y = near_x[ring], near_y[ring]
+
+    # 1. Drone's nearest cells (DR_NEAR) aren't these anymore
+    nearest = np_drones[:, c+near_x, c+near_y]
+    overwrite = (nearest == DR_NEAR) | (nearest == DR_VECT)
+    overwrite |= (keep & stuck)[:, None] & (nearest == DR_HERE)
+    overwrite &= writes[:, None]
+    nearest[overwrite] = DR_NONE
+    np_drones[:, c+near_x, c+near_y] = nearest
+
+    # Bit of a hack: if stuck, remove all foreign vector points
+    outer = np.ones((2*BIG_ZONE_R+1, 2*BIG_ZONE_R+1), dtype=bool)
+    outer[c-1:c+2, c-1:c+2] = False
+    outer_zone = np_drones[:, outer]
+    overwrite = (keep & stuck)[:, None] & ((outer_zone == DR_VECT) | (outer_zone == DR_NEAR))
+    outer_zone[overwrite] = DR_NONE
+    np_drones[:, outer] = outer_zone
+
+    # Removed drones disappear
+    np_drones[gone, c, c] = DR_NONE
+
+    # 2. Drone is now in a different cell
+    kept = np.flatnonzero(keep)
+    new_x = c + mov_dx[kept]
+    new_y = c + mov_dy[kept]
+    occupied = ((new_x != c) | (new_y != c)) & (np_drones[kept, new_x, new_y] == DR_HERE)
+    new_x[occupied] = c
+    new_y[occupied] = c
+    np_drones[kept, new_x, new_y] = DR_HERE
+
+    # 3. Drone's nearest cells are now these ones
+    for dx in range(-1, 1+1):
+        for dy in range(-1, 1+1):
+            value = np_drones[kept, new_x+dx, new_y+dy]
+            value[(value == DR_NONE) | (value == DR_VECT)] = DR_NEAR
+            np_drones[kept, new_x+dx, new_y+dy] = value
+
+    # 4. Drone isn't in its old cell anymore
+    moved = kept[(new_x != c) | (new_y != c)]
+    np_drones[moved, c, c] = DR_NONE
+
+    # 5. Drone's vector point is new
+    vect_x = new_x + mov_dx[kept]
+    vect_y = new_y + mov_dy[kept]
+    value = np_drones[kept, vect_x, vect_y]
+    value[(value == DR_NONE) | (value == DR_NEAR)] = DR_VECT
+    np_drones[kept, vect_x, vect_y] = value
+
+    return np_drones, np_visit, writes
+
+
+# Decisions and movement of all drones at once. Returns the modified drone and
+# visit layers of every "big zone", and which drones write their zone back.
+# Random picks come from rngs[i] for drone i, or from the module-level random.
+# With directions (see dsa_frontier), drones that gain nothing nearby follow them
+# instead of a random move, and instead of their heading unless keeps_heading
+def decide_and_move(zones, iter_count=0, coords=None, rngs=None, directions=None, keeps_heading=True):
+    decisions = decide_moves(zones, iter_count, coords, directions, keeps_heading)
+    return apply_moves(decisions, draw_picks(decisions, rngs))
+
+
+# Counts decisions the way the loop engine does: thrust, removal and being stuck
+# are only reached by drones that have some move, i.e. write their zone back
+def count_decisions(profiler, decisions):
+    writes = decisions['writes']
+    remove = decisions['remove']
+    profiler.count('drones', writes.shape[0])
+    profiler.count('thrust_away', (writes & decisions['thrust']).sum())
+    profiler.count('removed', (writes & remove).sum())
+    profiler.count('stuck', (writes & ~remove & decisions['stuck']).sum())
+
+
+# Same update as dsa_automaton.update_grid, computed for all drones at once;
+# decide stands for decide_moves, for engines that take the decisions elsewhere
+def update_grid_vectorized(grid, iter_count=0, coverage=None, profiler=None, frontier=None, decide=decide_moves):
+    grid_w, grid_h = grid.shape[0] - 2*PAD, grid.shape[1] - 2*PAD
+    interior = grid[PAD:PAD+grid_w, PAD:PAD+grid_h, L_DRON]
+    known = np.isin(interior, (DR_NONE, DR_NEAR, DR_VECT, DR_HERE))
+    if not known.all():
+        x, y = np.argwhere(~known)[0]
+        print(f'Problem with cell drone value: {int(interior[x, y])} at {x}, {y}')
+        return None
+
+    new_grid = grid.copy()
+    xs, ys = np.nonzero(interior == DR_HERE)
+    px, py = xs + PAD, ys + PAD
+    zones = gather_zones(grid, px, py)
+    directions = None if frontier is None else frontier.directions(grid, px, py)
+    keeps_heading = frontier is None or frontier.keeps_heading
+    decisions = decide(zones, iter_count, (xs, ys), directions, keeps_heading)
+    picks = draw_picks(decisions)
+    if profiler is not None:
+        profiler.lap('decide')
+    np_drones, np_visit, writes = apply_moves(decisions, picks)
+    if profiler is not None:
+        profiler.lap('move')
+
+    mx, my = drone_marks(grid)
+    sx, sy = stale_drone_marks(grid, mx, my)
+    write_zones(new_grid, px[writes], py[writes], np_drones[writes], np_visit[writes], sx, sy, coverage)
+    if frontier is not None:
+        frontier.record_zones(px[writes], py[writes], grid, new_grid)
+    if profiler is not None:
+        profiler.lap('write')
+        count_decisions(profiler, decisions)
+        profiler.count('marks_checked', mx.shape[0])
+        profiler.count('marks_cleared', sx.shape[0])
+    return new_grid